@@ -1,21 +1,43 @@
 #!/usr/bin/python3
 
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from copy import copy
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from datetime import timedelta
-from dateutil.rrule import rrule, YEARLY, MONTHLY, WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY, MO, TU, WE, TH, FR, SA, SU
+from functools import lru_cache, wraps
+from math import gcd
+from itertools import accumulate, compress, islice
+from operator import itemgetter
+from time import perf_counter
+try:
+    import numpy
+except ImportError: #pure Python fallback
+    numpy = None
+from dateutil.rrule import rrule, rrulestr, YEARLY, MONTHLY, WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY, MO, TU, WE, TH, FR, SA, SU
 
 
 class Event:
     """basic input of a Schedule"""
 
+    __slots__ = ("_title", "_description", "_start", "_duration", "_repeating")
+
     def __init__(self, title, description, start, duration, repeating = None):
         """Build an event.
 
         title -- short string identifying the event
         description -- string describing the event in detail
-        start -- datetime.datetime of the event's activation
+        start -- datetime.datetime of the event's activation, naive as Schedules do not support time zones
         duration -- datetime.timedelta as long as one occurrence of that event
-        repeating -- dateutil.rrule.rrule for recurring events (None if unique)
+        repeating -- dateutil.rrule.rrule for recurring events, with a naive dtstart (None if unique)
         """
         self._title = title
         self._description = description
@@ -38,6 +60,8 @@ Duration: {3};
 class Task (Event):
     """basic unit of a user's work to fit in a Schedule"""
 
+    __slots__ = ("_priority", "_due")
+
     def __init__(self, title, description, start, duration, priority, due, repeating = None):
         """Build a task
 
@@ -70,6 +94,8 @@ Due date: {5};
 class Occurrence:
     """Occurrence of an Event inside a Schedule"""
 
+    __slots__ = ("_event", "_start", "_duration")
+
     def __init__(self, event, start, duration):
         """Build an Occurrence.
 
@@ -85,9 +111,756 @@ class Occurrence:
         return "otto.Occurrence({0}, {1}, {2})".format(repr(self._event), repr(self._start), repr(self._duration))
 
 
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def _to_us(date):
+    """Return a naive datetime.datetime as microseconds since the epoch."""
+    if date.tzinfo != None:
+        raise ValueError("only naive datetimes are supported, not {}".format(date))
+    return (date - _EPOCH) // _US
+
+
+def _from_us(us):
+    """Return the datetime.datetime some microseconds after the epoch."""
+    return _EPOCH + timedelta(microseconds=us)
+
+
+def _runs(numbers):
+    """Yield the (first, last) bounds of the runs of consecutive integers of a sorted list."""
+    first = last = None
+    for n in numbers:
+        if last != None and n == last + 1:
+            last = n
+        else:
+            if last != None:
+                yield first, last
+            first = last = n
+    if last != None:
+        yield first, last
+
+
+class Stats:
+    """Measures of the scheduling pipeline, gathered while instrumentation is enabled
+
+    Stage times include the stages they call: a build includes the insertions in its timeline.
+    """
+
+    def __init__(self, callbacks=()):
+        """Build empty measures.
+
+        callbacks -- functions called with (stats, stage, seconds) every time a stage ends
+        """
+        self.seconds = dict() #stage -> total time spent in it
+        self.calls = dict() #stage -> number of times it ran
+        self.expanded = dict() #Event -> number of occurrences expanded from its rrule
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeline_size = 0 #length of the last timeline changed
+        self.timeline_peak = 0
+        self.callbacks = list(callbacks)
+
+    def record(self, stage, seconds):
+        """Add the time of a run of a stage."""
+        self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        for callback in self.callbacks:
+            callback(self, stage, seconds)
+
+    def hit_rate(self):
+        """Return the share of the windows found in the occurrence cache (None if none was looked for)."""
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else None
+
+    def prometheus(self):
+        """Return the measures in the Prometheus text exposition format."""
+        label = lambda s: str(s).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        expanded = dict()
+        for event, count in self.expanded.items():
+            expanded[event._title] = expanded.get(event._title, 0) + count
+        lines = ["# HELP otto_stage_seconds_total Time spent in each stage of the scheduling pipeline.",
+                 "# TYPE otto_stage_seconds_total counter"]
+        lines += ['otto_stage_seconds_total{{stage="{}"}} {!r}'.format(label(k), v) for k, v in self.seconds.items()]
+        lines += ["# HELP otto_stage_calls_total Runs of each stage of the scheduling pipeline.", "# TYPE otto_stage_calls_total counter"]
+        lines += ['otto_stage_calls_total{{stage="{}"}} {}'.format(label(k), v) for k, v in self.calls.items()]
+        lines += ["# HELP otto_expanded_occurrences_total Occurrences expanded from the rrule of each event.",
+                  "# TYPE otto_expanded_occurrences_total counter"]
+        lines += ['otto_expanded_occurrences_total{{event="{}"}} {}'.format(label(k), v) for k, v in expanded.items()]
+        lines += ["# HELP otto_cache_hits_total Windows found in the occurrence cache.", "# TYPE otto_cache_hits_total counter",
+                  "otto_cache_hits_total {}".format(self.cache_hits),
+                  "# HELP otto_cache_misses_total Windows expanded for the occurrence cache.", "# TYPE otto_cache_misses_total counter",
+                  "otto_cache_misses_total {}".format(self.cache_misses),
+                  "# HELP otto_timeline_occurrences Occurrences in the last timeline changed.", "# TYPE otto_timeline_occurrences gauge",
+                  "otto_timeline_occurrences {}".format(self.timeline_size),
+                  "# HELP otto_timeline_peak_occurrences Occurrences in the largest timeline.", "# TYPE otto_timeline_peak_occurrences gauge",
+                  "otto_timeline_peak_occurrences {}".format(self.timeline_peak)]
+        return "\n".join(lines) + "\n"
+
+
+#None while instrumentation is disabled, so that it only costs a test
+_stats = None
+
+
+def enable_stats(stats=None):
+    """Start gathering measures of the pipeline and return the Stats they go to.
+
+    stats -- Stats to add the measures to (default to new ones)
+    """
+    global _stats
+    _stats = stats if stats != None else Stats()
+    return _stats
+
+
+def disable_stats():
+    """Stop gathering measures and return the Stats they went to (None if they were not gathered)."""
+    global _stats
+    stats, _stats = _stats, None
+    return stats
+
+
+@contextmanager
+def profile(*callbacks):
+    """Gather the measures of what runs inside a with block, like the build of a Schedule, in Stats of their own.
+
+    callbacks -- functions called with (stats, stage, seconds) every time a stage ends
+    """
+    global _stats
+    previous, _stats = _stats, Stats(callbacks)
+    try:
+        yield _stats
+    finally:
+        _stats = previous
+
+
+def _timed(stage):
+    """Decorate a function to add its time to a stage while instrumentation is enabled."""
+    def decorate(function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            stats = _stats
+            if stats == None:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.record(stage, perf_counter() - start)
+        return timed
+    return decorate
+
+
+_DAY = 86400 * 10**6
+_WEEK = 7 * _DAY
+_UNITS = {WEEKLY: _WEEK, DAILY: _DAY, HOURLY: 3600 * 10**6, MINUTELY: 60 * 10**6, SECONDLY: 10**6}
+
+
+def _weekday(us):
+    """Return the weekday (0 for Monday) of a date in microseconds since the epoch."""
+    return (us // _DAY + 3) % 7
+
+
+def _closed_form(rule):
+    """Return the tuple (first, period, offsets, start, until) of a simple rrule, None if it is not simple enough.
+
+    A simple rule has a weekly or shorter fixed interval, optionally a weekday mask, and no count.
+    Its occurrences are the first + k * period + offset for every k >= 0 and sorted offset, from start to until included,
+    in microseconds since the epoch.
+    """
+    if (not isinstance(rule, rrule) or rule._freq not in _UNITS or rule._count != None
+            or set(getattr(rule, "_original_rule", {None: None})) - {"byweekday"}):
+        return None
+    start = _to_us(rule._dtstart)
+    until = sys.maxsize if rule._until == None else _to_us(rule._until)
+    mask = set(range(7) if rule._byweekday == None else rule._byweekday)
+    step = _UNITS[rule._freq] * rule._interval
+    if rule._freq == WEEKLY:
+        #weeks begin on wkst, only every interval-th one from the week of the start counts
+        first = start - (_weekday(start) - rule._wkst) % 7 * _DAY
+        return first, step, sorted((w - rule._wkst) % 7 * _DAY for w in mask), start, until
+    if len(mask) == 7:
+        return start, step, [0], start, until
+    #the weekdays of the occurrences repeat after the least common multiple of the interval and a week
+    period = step * _WEEK // gcd(step, _WEEK)
+    if period // step > 10000:
+        return None
+    return start, period, [o for o in range(0, period, step) if _weekday(start + o) in mask], start, until
+
+
+@_timed("expand")
+def _expand(rule, after, before):
+    """Return the array of the sorted starts of a rrule in [after, before), in microseconds since the epoch.
+
+    Simple rules (see _closed_form) are expanded by arithmetic, vectorized with NumPy when available, others by dateutil.
+    """
+    form = _closed_form(rule)
+    if form == None:
+        return array('q', (d for d in map(_to_us, rule.between(_from_us(after), _from_us(before), inc=True)) if d < before))
+    first, period, offsets, start, until = form
+    lo, hi = max(after, start), min(before, until + 1)
+    if hi <= lo:
+        return array('q')
+    k, last = max((lo - first) // period, 0), (hi - 1 - first) // period
+    if numpy != None:
+        starts = (numpy.arange(k, last + 1, dtype=numpy.int64)[:, None] * period + numpy.array(offsets, dtype=numpy.int64) + first).ravel()
+        return array('q', starts[(starts >= lo) & (starts < hi)].tobytes())
+    return array('q', (d for d in (first + i * period + o for i in range(k, last + 1) for o in offsets) if lo <= d < hi))
+
+
+class OccurrenceCache:
+    """LRU cache of the expanded windows of recurring events"""
+
+    def __init__(self, maxsize=1000000, window=timedelta(7)):
+        """Build an empty cache.
+
+        maxsize -- maximal number of occurrence dates kept in the cache
+        window -- datetime.timedelta length of the windows recurring events are expanded by
+        """
+        self._maxsize = maxsize
+        self._window = window
+        self._windows = OrderedDict() #(event, window) -> array of occurrence starts
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Give the number of occurrence dates in the cache."""
+        return self._size
+
+    def window_of(self, date):
+        """Return the number of the window containing a date."""
+        return (date - _EPOCH) // self._window
+
+    def window_start(self, window):
+        """Return the datetime.datetime where a window starts."""
+        return _EPOCH + window * self._window
+
+    def get(self, event, first, last):
+        """Return the sorted array of the starts of a recurring event from window first to window last (included).
+
+        Starts are microseconds since the epoch. Missing windows are expanded at once, see _expand.
+        """
+        missing = [w for w in range(first, last+1) if (event, w) not in self._windows]
+        self.hits += last + 1 - first - len(missing)
+        self.misses += len(missing)
+        if _stats != None:
+            _stats.cache_hits += last + 1 - first - len(missing)
+            _stats.cache_misses += len(missing)
+        fetched = dict()
+        if missing:
+            #one expansion over the hull of the missing windows, cut at their bounds
+            width = self._window // _US
+            expanded = _expand(event._repeating, missing[0] * width, (missing[-1] + 1) * width)
+            for w in missing:
+                fetched[w] = expanded[bisect_left(expanded, w * width):bisect_left(expanded, (w+1) * width)]
+            if _stats != None:
+                _stats.expanded[event] = _stats.expanded.get(event, 0) + len(expanded)
+        starts = array('q')
+        for w in range(first, last+1):
+            key = (event, w)
+            if w in fetched:
+                starts.extend(fetched[w])
+            else:
+                self._windows.move_to_end(key)
+                starts.extend(self._windows[key])
+        #only stored once every cached window was read, as storing may evict them
+        for w in missing:
+            self._put((event, w), fetched[w])
+        return starts
+
+    def _put(self, key, starts):
+        """Store the starts of a window, evicting the least recently used ones beyond maxsize."""
+        if len(starts) > self._maxsize:
+            return
+        self._windows[key] = starts
+        self._size += len(starts)
+        while self._size > self._maxsize:
+            self._size -= len(self._windows.popitem(last=False)[1])
+
+    def clear(self):
+        """Empty the cache."""
+        self._windows.clear()
+        self._size = 0
+
+
+#shared by every Schedule, so rebuilding one does not call dateutil again
+occurrence_cache = OccurrenceCache()
+
+
+class Timeline:
+    """Occurrences sorted by start, stored in parallel arrays
+
+    Starts and ends are int64 microseconds since the epoch, and an id column
+    points every occurrence back to its Event. Occurrence objects are only
+    built when asked for.
+    """
+
+    def __init__(self):
+        """Build an empty Timeline."""
+        self._starts = array('q')
+        self._ends = array('q')
+        self._ids = array('q')
+        self._events = list() #event table: id -> Event
+        self._ids_of = dict() #Event -> id
+        self._shared = False #columns and event table shared with another Timeline
+        self._head = 0 #position in the columns of the first occurrence, the ones before it were dropped (see drop_before)
+
+    def __len__(self):
+        """Give the number of occurrences in the Timeline."""
+        return len(self._starts) - self._head
+
+    def __getitem__(self, i):
+        """Build the Occurrence at a position (or the list of them in a slice) of the Timeline."""
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Timeline index out of range")
+        return self._occurrence(self._head + i)
+
+    def __iter__(self):
+        """Iterate over the Occurrences of the Timeline."""
+        for i in range(self._head, len(self._starts)):
+            yield self._occurrence(i)
+
+    def _occurrence(self, i):
+        """Build the Occurrence at a position in the columns, counting the dropped occurrences before the head."""
+        start = self._starts[i]
+        return Occurrence(self._events[self._ids[i]], _from_us(start), timedelta(microseconds=self._ends[i] - start))
+
+    def event_id(self, event):
+        """Return the id of an event in the event table, adding it if needed."""
+        eid = self._ids_of.get(event)
+        if eid == None:
+            self._own()
+            eid = self._ids_of[event] = len(self._events)
+            self._events.append(event)
+        return eid
+
+    @_timed("insert")
+    def insert(self, rows):
+        """Merge occurrences into the Timeline.
+
+        rows -- list of tuples (start, end, event id) sorted by start
+
+        Return the (position, date) from which the Timeline changed (None if it did not).
+        """
+        if not rows:
+            return None
+        self._own()
+        lo = bisect_left(self._starts, rows[0][0])
+        hi = bisect_right(self._starts, rows[-1][0])
+        current = zip(self._starts[lo:hi], self._ends[lo:hi], self._ids[lo:hi])
+        starts, ends, ids = zip(*heapq.merge(current, rows))
+        self._starts[lo:hi] = array('q', starts)
+        self._ends[lo:hi] = array('q', ends)
+        self._ids[lo:hi] = array('q', ids)
+        if _stats != None:
+            _stats.timeline_size = len(self)
+            _stats.timeline_peak = max(_stats.timeline_peak, len(self))
+        return lo, rows[0][0]
+
+    @_timed("remove")
+    def remove(self, event):
+        """Remove every occurrence of an event from the Timeline.
+
+        Return the (position, date) from which the Timeline changed (None if it did not).
+        """
+        eid = self._ids_of.get(event)
+        if eid == None:
+            return None
+        self._own()
+        #everything before the first occurrence of the event stays in place
+        try:
+            lo = self._ids.index(eid, self._head)
+        except ValueError:
+            return None
+        change = lo, self._starts[lo]
+        keep = list(map(eid.__ne__, self._ids[lo:]))
+        self._starts[lo:] = array('q', compress(self._starts[lo:], keep))
+        self._ends[lo:] = array('q', compress(self._ends[lo:], keep))
+        self._ids[lo:] = array('q', compress(self._ids[lo:], keep))
+        if _stats != None:
+            _stats.timeline_size = len(self)
+        return change
+
+    def drop_before(self, date):
+        """Drop the occurrences ending before a date and shave the ones still running at it to start there.
+
+        The occurrences kept are moved up next to the later ones and the head moves past the others, which stay in the
+        columns until they fill half of them: dropping takes amortized constant time per occurrence dropped.
+        The positions of the later occurrences do not change until then.
+
+        date -- microseconds since the epoch
+
+        Return True if the columns were compacted, changing the positions of the occurrences.
+        """
+        p = bisect_left(self._starts, date, self._head)
+        if p == self._head:
+            return False
+        self._own()
+        kept = [i for i in range(self._head, p) if self._ends[i] > date]
+        head = p - len(kept)
+        ends, ids = array('q', (self._ends[i] for i in kept)), array('q', (self._ids[i] for i in kept))
+        #same length slices: nothing after them moves
+        self._starts[head:p] = array('q', [date]) * len(kept)
+        self._ends[head:p], self._ids[head:p] = ends, ids
+        #what is left before the head ends by the date, for the busy index to never see it after it
+        self._ends[self._head:head] = array('q', (min(e, date) for e in self._ends[self._head:head]))
+        self._head = head
+        if _stats != None:
+            _stats.timeline_size = len(self)
+        if 2 * head <= len(self._starts):
+            return False
+        self._compact()
+        return True
+
+    def _compact(self):
+        """Free the occurrences dropped before the head, and the events of the event table none points to anymore."""
+        del self._starts[:self._head], self._ends[:self._head], self._ids[:self._head]
+        self._head = 0
+        used = sorted(set(self._ids))
+        ids = dict(zip(used, range(len(used))))
+        self._events = [self._events[i] for i in used]
+        self._ids_of = {e: i for i, e in enumerate(self._events)}
+        self._ids = array('q', map(ids.__getitem__, self._ids))
+
+    def share(self):
+        """Return a Timeline sharing the columns and event table of this one, both copying them before their next change."""
+        other = copy(self)
+        self._shared = other._shared = True
+        return other
+
+    def _own(self):
+        """Copy the columns into arrays of their own before changing them.
+
+        They may be views on a file (see load_schedule) or shared with another Timeline (see share).
+        """
+        if self._shared:
+            self._events, self._ids_of = list(self._events), dict(self._ids_of)
+        if self._shared or isinstance(self._starts, memoryview):
+            self._starts, self._ends, self._ids = (array('q', c.tobytes()) for c in (self._starts, self._ends, self._ids))
+        self._shared = False
+
+
+class _BusyIndex:
+    """Merged busy blocks of a Timeline with prefix sums of busy time
+
+    Every date and length is in microseconds since the epoch.
+    """
+
+    def __init__(self, timeline):
+        """Build the index in one pass.
+
+        timeline -- Timeline to index
+        """
+        self._starts = list() #start of each merged block
+        self._ends = list() #end of each merged block, sorted as well
+        self._first = [timeline._head] #position in the timeline of the first occurrence of each block, then its length
+        self._busy = [0] #busy time before each block
+        self._arrays = None
+        self.update(timeline, timeline._head, _to_us(datetime.min))
+
+    def update(self, timeline, position, date):
+        """Rebuild the blocks after a change of the timeline, keeping the ones that end before it.
+
+        timeline -- Timeline indexed
+        position -- position in the timeline of the first occurrence that changed
+        date -- start of the first occurrence that changed
+        """
+        k = bisect_left(self._ends, date)
+        position = min(position, self._first[k])
+        del self._starts[k:], self._ends[k:], self._first[k:], self._busy[k+1:]
+        self._arrays = None
+        starts, ends = timeline._starts[position:], timeline._ends[position:]
+        if numpy != None and len(starts):
+            self._merge_numpy(starts, ends, position)
+        else:
+            for i, (s, e) in enumerate(zip(starts, ends), position):
+                if len(self._ends) > k and s <= self._ends[-1]:
+                    if e > self._ends[-1]:
+                        self._ends[-1] = e
+                else:
+                    self._starts.append(s)
+                    self._ends.append(e)
+                    self._first.append(i)
+        self._first.append(len(timeline._starts))
+        before = self._busy[k]
+        self._busy.extend(before + b for b in accumulate(e - s for s, e in zip(self._starts[k:], self._ends[k:])))
+
+    def copy(self):
+        """Return a copy of the index, to update without changing this one."""
+        other = copy(self)
+        other._starts, other._ends, other._first, other._busy = list(self._starts), list(self._ends), list(self._first), list(self._busy)
+        return other
+
+    def _merge_numpy(self, starts, ends, position):
+        """Append the blocks of some occurrences sorted by start, with vectorized operations."""
+        starts = numpy.frombuffer(starts, dtype=numpy.int64)
+        reach = numpy.maximum.accumulate(numpy.frombuffer(ends, dtype=numpy.int64))
+        #a block begins where an occurrence starts after everything before it has ended
+        new = numpy.ones(len(starts), dtype=bool)
+        numpy.greater(starts[1:], reach[:-1], out=new[1:])
+        first = numpy.flatnonzero(new)
+        self._starts.extend(starts[first].tolist())
+        self._ends.extend(reach[numpy.append(first[1:], len(starts)) - 1].tolist())
+        self._first.extend((first + position).tolist())
+
+    def _get_arrays(self):
+        """Return the NumPy arrays of the block starts, ends and busy prefix sums for batch queries."""
+        if self._arrays == None:
+            self._arrays = tuple(numpy.array(a, dtype=numpy.int64) for a in (self._starts, self._ends, self._busy))
+        return self._arrays
+
+    def busy_until(self, date):
+        """Return the busy time before a date."""
+        i = bisect_right(self._starts, date) - 1
+        if i < 0:
+            return 0
+        return self._busy[i] + min(date, self._ends[i]) - self._starts[i]
+
+    def free_times(self, afters, befores, floor=_to_us(datetime.min)):
+        """Return the list of the free times inside many windows [after, before).
+
+        afters, befores -- lists of dates of the windows, of the same length
+        floor -- date before which nothing counts as busy
+        """
+        if numpy == None or not self._starts:
+            return [max(b - a - self.busy_until(max(b, floor)) + self.busy_until(max(a, floor)), 0) for a, b in zip(afters, befores)]
+        afters = numpy.asarray(afters, dtype=numpy.int64)
+        befores = numpy.asarray(befores, dtype=numpy.int64)
+        busy = self._np_busy_until(numpy.maximum(befores, floor)) - self._np_busy_until(numpy.maximum(afters, floor))
+        return numpy.maximum(befores - afters - busy, 0).tolist()
+
+    def _np_busy_until(self, dates):
+        """Return the busy time before every date of an array."""
+        starts, ends, prefix = self._get_arrays()
+        i = numpy.searchsorted(starts, dates, side="right") - 1
+        j = numpy.maximum(i, 0)
+        busy = prefix[j] + numpy.minimum(dates, ends[j]) - starts[j]
+        return numpy.where(i < 0, 0, busy)
+
+    def blocks(self, after, before):
+        """Return the range of the blocks overlapping [after, before)."""
+        return range(bisect_right(self._ends, after), bisect_left(self._starts, before))
+
+    def free_intervals(self, after, before):
+        """Return the list of the free intervals (start, end) inside [after, before)."""
+        blocks = self.blocks(after, before)
+        if not blocks:
+            return [(after, before)]
+        lo, hi = blocks.start, blocks.stop
+        #merged blocks never touch: there is a gap between two consecutive ones
+        intervals = list(zip(self._ends[lo:hi-1], self._starts[lo+1:hi]))
+        if self._starts[lo] > after:
+            intervals.insert(0, (after, self._starts[lo]))
+        if self._ends[hi-1] < before:
+            intervals.append((self._ends[hi-1], before))
+        return intervals
+
+
+class _FreeSpace:
+    """Free intervals cut into atoms at release dates, kept in a segment tree of free runs
+
+    Atoms are only ever consumed from their left, so a run of free time starts at the
+    first free point of an atom and goes on through the following atoms while they are
+    untouched and contiguous. Every date and length is in microseconds since the epoch.
+    """
+
+    def __init__(self, intervals, cuts):
+        """Build the tree.
+
+        intervals -- sorted list of disjoint free intervals (start, end)
+        cuts -- sorted list of dates where to cut the intervals
+        """
+        lo, hi = self._lo, self._hi = list(), list()
+        j = 0
+        for s, e in intervals:
+            j = bisect_right(cuts, s, j)
+            while j < len(cuts) and cuts[j] < e:
+                lo.append(s)
+                hi.append(cuts[j])
+                s = cuts[j]
+                j += 1
+            lo.append(s)
+            hi.append(e)
+        self._free = list(lo) #first free point of each atom
+        n = self._n = len(lo)
+        size = self._size = 1 << max(n - 1, 0).bit_length()
+        self._pre = [0] * (2 * size) #free run from the left edge of a node
+        self._suf = [0] * (2 * size) #free run up to the right edge of a node
+        self._sufstart = [0] * (2 * size) #atom where that run starts
+        self._best = [0] * (2 * size) #longest free run inside a node
+        self._full = [False] * (2 * size) #node untouched and contiguous
+        self._joint = [False] * size #children of a node contiguous
+        for k in range(size):
+            self._sufstart[size + k] = k
+        for i in range(n):
+            self._set_leaf(i)
+        for k in range(size - 1, 0, -1):
+            #the left child of k ends with atom m-1, the right one starts with atom m
+            depth = k.bit_length() - 1
+            span = size >> depth
+            m = (k - (1 << depth)) * span + span // 2
+            self._joint[k] = m < n and hi[m-1] == lo[m]
+            self._pull(k)
+
+    def _set_leaf(self, i):
+        """Refresh the leaf of an atom."""
+        k = self._size + i
+        free = self._hi[i] - self._free[i]
+        full = self._free[i] == self._lo[i]
+        self._pre[k] = free if full else 0
+        self._suf[k] = self._best[k] = free
+        self._full[k] = full
+
+    def _pull(self, k):
+        """Refresh a node from its children."""
+        a, b = 2 * k, 2 * k + 1
+        joint = self._joint[k]
+        pre, suf = self._pre, self._suf
+        self._full[k] = self._full[a] and self._full[b] and joint
+        pre[k] = pre[a] + pre[b] if self._full[a] and joint else pre[a]
+        if self._full[b] and joint:
+            suf[k] = suf[a] + suf[b]
+            self._sufstart[k] = self._sufstart[a] if suf[a] else self._sufstart[b]
+        else:
+            suf[k] = suf[b]
+            self._sufstart[k] = self._sufstart[b]
+        self._best[k] = max(self._best[a], self._best[b], suf[a] + pre[b] if joint else 0)
+
+    def first_fit(self, release, length):
+        """Return the atom where the earliest free run of some length after a date starts (None if there is not any)."""
+        i = bisect_left(self._lo, release)
+        if i >= self._n:
+            return None
+        return self._find(1, 0, self._size, i, length, 0, None)[0]
+
+    def _find(self, k, l, r, first, length, carry, start):
+        """Look for the run in node k covering atoms [l, r), given the run of some length from atom start entering it.
+
+        Return a tuple (atom found or None, run leaving the node, atom where it starts).
+        """
+        if r <= first:
+            return None, 0, None
+        if l >= first:
+            if carry and carry + self._pre[k] >= length:
+                return start, 0, None
+            if self._best[k] < length:
+                if self._full[k]:
+                    return None, carry + self._pre[k], start if carry else l
+                return None, self._suf[k], self._sufstart[k]
+            if k >= self._size:
+                return l, 0, None
+        m = (l + r) // 2
+        found, carry, start = self._find(2 * k, l, m, first, length, carry, start)
+        if found != None:
+            return found, 0, None
+        if not self._joint[k]:
+            carry = 0
+        return self._find(2 * k + 1, m, r, first, length, carry, start)
+
+    def take(self, i, length):
+        """Consume some length of free time from the first free point of an atom and return where it starts."""
+        start = self._free[i]
+        end = start + length
+        while True:
+            self._free[i] = min(self._hi[i], end)
+            self._set_leaf(i)
+            k = (self._size + i) >> 1
+            while k:
+                self._pull(k)
+                k >>= 1
+            if self._hi[i] >= end:
+                return start
+            i += 1
+
+
+class Availability:
+    """Grid of the free slots of a Schedule between two dates, packed as the bits of an integer
+
+    Bit i is set when the i-th slot is free. Grids of the same slots combine with & (free in both), | (free in either)
+    and ~ (busy), one machine word at a time, and count() tells how many of their slots are free.
+    """
+
+    def __init__(self, start, slot, size, bits):
+        """Build a grid.
+
+        start -- datetime.datetime where the first slot starts
+        slot -- datetime.timedelta of the length of the slots
+        size -- number of slots
+        bits -- integer whose bit i is set when the i-th slot is free
+        """
+        self._start = start
+        self._slot = slot
+        self._size = size
+        self._bits = bits
+
+    def __repr__(self):
+        """Give the string representation of the grid"""
+        return "otto.Availability({0}, {1}, {2}, {3})".format(repr(self._start), repr(self._slot), self._size, hex(self._bits))
+
+    def __len__(self):
+        """Give the number of slots of the grid."""
+        return self._size
+
+    def _same(self, other, bits):
+        """Return a grid of the same slots as this one and another one, with other bits."""
+        if (self._start, self._slot, self._size) != (other._start, other._slot, other._size):
+            raise ValueError("grids of different slots do not combine")
+        return Availability(self._start, self._slot, self._size, bits)
+
+    def __and__(self, other):
+        """Give the grid of the slots free in both grids."""
+        return self._same(other, self._bits & other._bits)
+
+    def __or__(self, other):
+        """Give the grid of the slots free in either grid."""
+        return self._same(other, self._bits | other._bits)
+
+    def __invert__(self):
+        """Give the grid of the busy slots."""
+        return Availability(self._start, self._slot, self._size, ~self._bits & ((1 << self._size) - 1))
+
+    def count(self):
+        """Return the number of free slots."""
+        return self._bits.bit_count()
+
+    def fits(self, duration):
+        """Return the grid of the slots where something lasting a duration can start, every slot it spans being free.
+
+        duration -- datetime.timedelta of what to fit, rounded up to whole slots
+        """
+        span = max(-(-duration // self._slot), 1)
+        bits, covered = self._bits, 1
+        #doubling the run of free slots each bit stands for, then the rest of it
+        while 2 * covered <= span:
+            bits &= bits >> covered
+            covered *= 2
+        if covered < span:
+            bits &= bits >> (span - covered)
+        return Availability(self._start, self._slot, self._size, bits)
+
+    def intervals(self):
+        """Return the list of the tuples (datetime.datetime, datetime.datetime) of the free intervals, merging the slots."""
+        text = format(self._bits, "b")[::-1]
+        intervals = list()
+        end = 0
+        while True:
+            begin = text.find("1", end)
+            if begin < 0:
+                return intervals
+            end = text.find("0", begin)
+            if end < 0:
+                end = len(text)
+            intervals.append((self._start + begin * self._slot, self._start + end * self._slot))
+
+
 class Schedule:
     """Auto-organizing Schedule"""
 
+    @_timed("build")
     def __init__(self, events, tasks, start=None):
         """Build a Schedule.
 
@@ -98,101 +871,792 @@ class Schedule:
         #in case we want to sort it: events_, tasks_ = sorted(events, key=lambda e: e.start), sorted(tasks, key=lambda t: t.start)
 
         self._start = start if start != None else events[0]._start
-        self._timeline = list()
         
         #finding the due date of the last task
-        self._end = tasks[0]._due
-        for t in tasks[1:]:
-            if t._due > self._end:
-                self._end = t._due
-        for e in events: self._add_event(e)
-
-        #truncating the part of the timeline before start
-        if self._timeline[0]._start < self.start:
-            tronc = 0
-            for i, o in enumerate(self._timeline):
-                if o._start + o._duration <= self.start:
-                    tronc = i #identify where the start is;
-            del self._timeline[:i+1] #remove what ends before;
-            for o in self._timeline: #and shave what starts before.
-                if o._start < self._start:
-                    o._duration -= (self._start - o._start)
-                    o._start = self._start
+        self._end = max((t._due for t in tasks), default=self._start)
+
+        self._tasks = list(tasks)
+        self._placed = None #placements (start, duration, task, release) sorted by start
+        self._unplaced = None #instances (task, release) that do not fit
+        self._placement = None
+
+        #every change bumps the version and is logged for callers to invalidate their own caches
+        self._version = 0
+        self._changes = deque(maxlen=1000)
+        self._replan = None #date from which the placements are outdated
+
+        #recurring events are only expanded in the windows queries look at
+        self._cache = occurrence_cache
+        self._recurring = [e for e in events if e._repeating != None]
+        self._reach = max((e._duration for e in self._recurring), default=timedelta(0))
+        self._expanded = set()
+
+        #every event gives an already sorted stream: merge them in one pass
+        self._timeline = Timeline()
+        streams = [self._rows(e) for e in events if e._repeating == None]
+        self._timeline.insert(list(heapq.merge(*streams)))
+        self._index = None
+        self._dirty = None #(position, date) from which the busy index is outdated
+        self._index_shared = False #busy index shared with a fork or the parent of one
+
+        #lists and sets are replaced rather than changed in place, for forks to share them
+        self._parent = None
+        self._edits = None #changes (method, arguments) made to a fork, replayed on its parent on commit
+        self._origins = dict() #copy made by a change -> event or task given to the Schedule (or its parent) it was made from
+        self._current = dict() #event or task given to a change -> copy of it the Schedule holds instead
+
     def __repr__(self):
         """Give the string representation of the timeline's content"""
+        self._ensure(self._start, self._end)
         return "list({0})".format(",\n".join(repr(o) for o in self._timeline))
 
     def __str__(self):
         """Give the user-friendly string representation of the Schedule"""
+        self._ensure(self._start, self._end)
         return '\n'.join("from {0} to {1}: {2}".format(o._start, o._start + o._duration, o._event._title) for o in self._timeline)
 
 
-    def _add_event(self, event):
+    def _rows(self, event, first=None, last=None, since=None):
+        """Yield the occurrences (start, end, event id) of an event inside the Schedule, sorted by start.
+
+        Occurrences ending before the start of the Schedule are dropped, the ones starting before it are shaved.
+
+        event -- Event to expand
+        first, last -- windows of the cache to expand a recurring event in
+        since -- only keep the occurrences starting after that many microseconds since the epoch
+        """
+        eid = self._timeline.event_id(event)
+        duration = event._duration // _US
+        start = _to_us(self._start)
+        if event._repeating == None:
+            starts = (_to_us(event._start),)
+        else:
+            #looking back one duration catches the occurrence still running at start
+            lo, hi = start - duration, _to_us(self._end)
+            if since != None:
+                lo = max(lo, since + 1)
+            starts = (d for d in self._cache.get(event, first, last) if lo <= d <= hi)
+        for s in starts:
+            if s + duration > start:
+                yield (max(s, start), s + duration, eid)
+
+    def _ensure(self, after, before):
+        """Expand the recurring events in every window a query between two dates can see."""
+        lo, hi = max(after, self._start) - self._reach, min(before, self._end)
+        if hi < lo:
+            return
+        windows = range(self._cache.window_of(lo), self._cache.window_of(hi) + 1)
+        todo = [w for w in windows if w not in self._expanded]
+        for first, last in _runs(todo):
+            streams = [self._rows(e, first, last) for e in self._recurring]
+            self._touch(self._timeline.insert(list(heapq.merge(*streams))))
+        if todo:
+            self._expanded = self._expanded.union(todo)
+
+    def _extend(self, end):
+        """Push the end of the Schedule to a later date, expanding what the already expanded windows now see."""
+        old = _to_us(self._end)
+        self._end = end
+        w = self._cache.window_of(_from_us(old))
+        if w in self._expanded:
+            streams = [self._rows(e, w, w, old) for e in self._recurring]
+            self._touch(self._timeline.insert(list(heapq.merge(*streams))))
+
+    def _touch(self, change):
+        """Note that the timeline changed from a (position, date), for the busy index to be updated from there."""
+        if change == None or self._index == None:
+            return
+        if self._dirty == None:
+            self._dirty = change
+        else:
+            self._dirty = (min(self._dirty[0], change[0]), min(self._dirty[1], change[1]))
+
+    def _log(self, kind, subject, date):
+        """Record a change of the Schedule and replan the tasks from the date (in microseconds since the epoch) it affects."""
+        self._version += 1
+        self._changes.append((self._version, kind, subject, None if date == None else _from_us(date)))
+        if date != None:
+            self._replan = date if self._replan == None else min(self._replan, date)
+
+    def _insert_event(self, event):
+        """Insert the Occurrences of an event in the expanded part of the timeline and return the date of the first one."""
         if event._repeating == None:
-            self._add_occ(Occurrence(event, event._start, event._duration))
+            changes = [self._timeline.insert(list(self._rows(event)))]
+        else:
+            changes = [self._timeline.insert(list(self._rows(event, first, last))) for first, last in _runs(sorted(self._expanded))]
+        changes = [c for c in changes if c != None]
+        for c in changes:
+            self._touch(c)
+        return min((c[1] for c in changes), default=None)
+
+    def _record(self, method, *args):
+        """Record a change made to a fork, to replay it on its parent on commit."""
+        if self._edits != None:
+            self._edits.append((method, args))
+
+    def _resolve(self, subject):
+        """Return the copy the Schedule holds in place of an event or a task given to an earlier change, or the object itself."""
+        return self._current.get(subject, subject)
+
+    def _copy(self, subject):
+        """Return a copy of an event or a task to change in its place, leaving the object untouched as other Schedules
+        (or the parent of a fork) may hold it.
+
+        Later changes given the object, or any earlier copy of it, apply to the copy.
+        """
+        changed = copy(subject)
+        self._current = {k: changed if v is subject else v for k, v in self._current.items()}
+        self._current[subject] = changed
+        self._origins = dict(self._origins)
+        self._origins[changed] = self._origins.get(subject, subject)
+        return changed
+
+    @_timed("add_event")
+    def add_event(self, event):
+        """Insert every Occurrence of an event in the timeline.
+
+        event -- Event to add to the Schedule
+        """
+        self._record("add_event", event)
+        if event._repeating != None:
+            self._recurring = self._recurring + [event]
+            self._reach = max(self._reach, event._duration)
+        self._log("add_event", event, self._insert_event(event))
+
+    @_timed("remove_event")
+    def remove_event(self, event):
+        """Remove every Occurrence of an event from the timeline.
+
+        event -- Event to remove from the Schedule
+        """
+        event = self._resolve(event)
+        self._record("remove_event", event)
+        self._recurring = [e for e in self._recurring if e is not event]
+        change = self._timeline.remove(event)
+        self._touch(change)
+        self._log("remove_event", event, None if change == None else change[1])
+
+    @_timed("move_event")
+    def move_event(self, event, start):
+        """Move an event of the Schedule (with all its occurrences if it is recurring) to a new start.
+
+        Return the event moved: a moved copy of it, as other Schedules (or the parent of a fork) may hold the event given
+        and keep it where it was. Later changes may be given either.
+
+        event -- Event to move
+        start -- datetime.datetime of the new start of the event
+        """
+        event = self._resolve(event)
+        self._record("move_event", event, start)
+        change = self._timeline.remove(event)
+        self._touch(change)
+        moved = self._copy(event)
+        #like removing then adding it, whatever the windows expanded, an event removed before is added again
+        if moved._repeating != None:
+            self._recurring = [e for e in self._recurring if e is not event] + [moved]
+            rule = moved._repeating
+            moved._repeating = rule.replace(dtstart=rule._dtstart + (start - moved._start))
+        moved._start = start
+        dates = [d for d in (None if change == None else change[1], self._insert_event(moved)) if d != None]
+        self._log("move_event", moved, min(dates, default=None))
+        return moved
+
+    def add_task(self, task):
+        """Add a task to place in the Schedule.
+
+        task -- Task to add, its due date may push the end of the Schedule
+        """
+        self._record("add_task", task)
+        self._tasks = self._tasks + [task]
+        date = None
+        if task._due > self._end:
+            date = _to_us(self._end)
+            self._extend(task._due)
+        first = next(self._instances(task), None)
+        if first != None:
+            date = first[0] if date == None else min(date, first[0])
+        self._log("add_task", task, date)
+
+    def set_priority(self, task, priority):
+        """Change the priority of a task of the Schedule.
+
+        Return the task changed: a copy of it, as other Schedules (or the parent of a fork) may hold the task given and
+        keep it as it was. Later changes may be given either.
+
+        task -- Task to change
+        priority -- integer representing the new importance of the task
+        """
+        task = self._resolve(task)
+        self._record("set_priority", task, priority)
+        changed = self._copy(task)
+        self._tasks = [changed if t is task else t for t in self._tasks]
+        changed._priority = priority
+        first = next(self._instances(changed), None)
+        self._log("set_priority", changed, None if first == None else first[0])
+        return changed
+
+    def complete_task(self, task):
+        """Remove a task done from the Schedule, freeing the time it was placed at.
+
+        task -- Task to remove
+        """
+        task = self._resolve(task)
+        self._record("complete_task", task)
+        self._tasks = [t for t in self._tasks if t is not task]
+        date = None
+        if self._placed != None:
+            date = min((p[0] for p in self._placed if p[2] is task), default=None)
+            self._placed = [p for p in self._placed if p[2] is not task]
+            self._unplaced = [u for u in self._unplaced if u[0] is not task]
+            self._placement = None
+        self._log("complete_task", task, date)
+
+    def advance(self, start, end=None):
+        """Move the Schedule forward in time, for a long-running process to keep one rolling rather than build it again.
+
+        The occurrences ending before the new start are dropped from the front of the timeline and the ones still
+        running are shaved, in amortized constant time per occurrence dropped, while the recurring events are expanded
+        past the old end on demand as usual. The expired windows, tasks and placements are dropped as well, so memory is
+        bounded by the length of the Schedule rather than by how long it has been running.
+
+        start -- datetime.datetime of the new beginning of the Schedule, after the current one
+        end -- datetime.datetime of the new end of the Schedule, not before the current one (default to keep its length)
+        """
+        if start <= self._start:
+            raise ValueError("a Schedule only advances forward, not to {}".format(start))
+        if end == None: end = self._end + (start - self._start)
+        if end < self._end:
+            raise ValueError("the end of a Schedule only moves forward, not to {}".format(end))
+        self._record("advance", start, end)
+        self._start = start
+        if self._timeline.drop_before(_to_us(start)):
+            self._index, self._dirty, self._index_shared = None, None, False
+        if end > self._end:
+            self._extend(end)
+        #the windows before this one only hold occurrences ending before the start
+        first = self._cache.window_of(start - self._reach)
+        self._expanded = {w for w in self._expanded if w >= first}
+        self._tasks = [t for t in self._tasks if t._repeating != None or t._due > start]
+        if self._placed != None:
+            #the placements still running are redone from the start as their instances are now released there
+            self._placed, self._unplaced, self._placement = list(), list(), None
+        self._log("advance", None, _to_us(start))
+
+    def fork(self):
+        """Return a copy-on-write fork of the Schedule, for what-if planning.
+
+        Forking takes constant time: the fork shares the expanded timeline, the busy index and the placements of the
+        Schedule, and each of them copies a structure before its first change of it. Events and tasks shared with the
+        Schedule are never changed by the fork, which changes copies of them (see move_event and set_priority) and
+        applies later changes given the shared ones to the copies. The Schedule should only be changed
+        through the commits of its forks while they are in use.
+        """
+        fork = copy(self)
+        fork._timeline = self._timeline.share()
+        self._index_shared = fork._index_shared = self._index != None
+        fork._changes = deque(maxlen=1000)
+        fork._parent, fork._edits = self, list()
+        return fork
+
+    def commit(self):
+        """Replay the changes made to a fork on its parent, in order, and return the parent."""
+        origin = lambda a: self._origins.get(a, a) if isinstance(a, Event) else a
+        for method, args in self._edits:
+            getattr(self._parent, method)(*map(origin, args))
+        self._edits = list()
+        return self._parent
+
+    def diff(self, after=None, before=None):
+        """Return the tuple (added, removed) of the lists of the Occurrences starting between two dates that are in the
+        timeline of a fork and not in the one of its parent, and the other way around, sorted by start.
+
+        The copies made by move_event count as the events they were made from.
+
+        after -- datetime.datetime of the beginning of the comparison (default to the start of the fork)
+        before -- datetime.datetime of the end of the comparison (default to the end of the fork)
+        """
+        if after == None: after = self._start
+        if before == None: before = self._end
+        rows = list()
+        for schedule in (self, self._parent):
+            schedule._ensure(after, before)
+            timeline = schedule._timeline
+            lo = bisect_left(timeline._starts, _to_us(after), timeline._head)
+            hi = bisect_left(timeline._starts, _to_us(before), timeline._head)
+            events = [schedule._origins.get(e, e) for e in timeline._events]
+            rows.append(Counter(zip(timeline._starts[lo:hi], timeline._ends[lo:hi], (events[i] for i in timeline._ids[lo:hi]))))
+        occurrences = lambda counter: sorted((Occurrence(e, _from_us(s), timedelta(microseconds=end - s)) for s, end, e in counter.elements()),
+                                             key=lambda o: o._start)
+        return occurrences(rows[0] - rows[1]), occurrences(rows[1] - rows[0])
+
+    def get_version(self):
+        """Return the number of changes made to the Schedule since it was built."""
+        return self._version
+
+    def get_changes(self, since):
+        """Return the list of the changes (version, kind, subject, date) made after a version.
+
+        The date of a change is the earliest datetime.datetime it affects (None if it does not affect the timeline).
+        Return None when the log does not go back that far anymore.
+
+        since -- version the caller is up to date with
+        """
+        if since < self._version - len(self._changes):
+            return None
+        return [c for c in self._changes if c[0] > since]
+
+    def _get_index(self):
+        """Return the busy index of the timeline, updating it from where the timeline changed."""
+        if self._index != None and self._dirty == None:
+            return self._index
+        #only the actual builds and updates are timed, the index being asked for by every query
+        stats, start = _stats, perf_counter()
+        if self._index == None:
+            self._index = _BusyIndex(self._timeline)
         else:
-            #will probably be better with rrule.replace()
-            for d in event._repeating.between(self._start, self._end, inc=True):
-                self._add_occ(Occurrence(event, d, event._duration))
+            if self._index_shared:
+                self._index, self._index_shared = self._index.copy(), False
+            self._index.update(self._timeline, *self._dirty)
+        self._dirty = None
+        if stats != None:
+            stats.record("index", perf_counter() - start)
+        return self._index
+
+    def _instances(self, task):
+        """Yield the tuples (release, due) of the instances of a task inside the Schedule, in microseconds since the epoch."""
+        start, end = _to_us(self._start), _to_us(self._end)
+        if task._repeating == None:
+            yield max(_to_us(task._start), start), _to_us(task._due)
+            return
+        #every instance has as long to be done as the first one
+        first = task._repeating.after(task._start, inc=True)
+        if first == None:
+            return
+        slack = _to_us(task._due) - _to_us(first)
+        lo = _from_us(start - slack)
+        for d in self._cache.get(task, self._cache.window_of(lo), self._cache.window_of(self._end)):
+            if start - slack < d <= end:
+                yield max(d, start), d + slack
+
+    @_timed("place")
+    def place_tasks(self):
+        """Place every task instance in the free time of the Schedule, by earliest due date then highest priority.
 
-    def _add_occ(self, occ):
-        self._timeline.append(occ)
-        self._timeline.sort(key=lambda o: o._start)
+        After changes, only the placements ending after the earliest change are redone.
+
+        Return a tuple (placed, unplaced): placed is the list of the Occurrences of the tasks sorted by start,
+        unplaced the list of the tuples (task, release) of the instances that do not fit before their due date.
+        """
+        self._ensure(self._start, self._end)
+        if self._placed == None:
+            self._placed = list()
+            self._plan(_to_us(self._start))
+        elif self._replan != None:
+            self._plan(self._replan)
+        self._replan = None
+        if self._placement == None:
+            self._placement = ([Occurrence(task, _from_us(s), timedelta(microseconds=d)) for s, d, task, r in self._placed],
+                               [(task, _from_us(r)) for task, r in self._unplaced])
+        return self._placement
 
-    def get_free_time(self,after, before=None):
+    def _plan(self, since):
+        """Place the task instances from a date on, keeping the placements that end before it.
+
+        since -- microseconds since the epoch from which placing again
+        """
+        since, end = max(since, _to_us(self._start)), _to_us(self._end)
+        alive = set(self._tasks)
+        kept = [p for p in self._placed if p[0] + p[1] <= since and p[2] in alive]
+        done = {(p[2], p[3]) for p in kept}
+        queue = list()
+        for t in self._tasks:
+            duration = t._duration // _US
+            for release, due in self._instances(t):
+                if (t, release) not in done:
+                    queue.append((due, -t._priority, len(queue), max(release, since), duration, t, release))
+        heapq.heapify(queue)
+        intervals = self._get_index().free_intervals(since, end) if since < end else list()
+        space = _FreeSpace(intervals, sorted({q[3] for q in queue}))
+        placed, unplaced = list(), list()
+        while queue:
+            due, _, _, after, duration, task, release = heapq.heappop(queue)
+            i = space.first_fit(after, duration)
+            if i == None or space._free[i] + duration > due:
+                unplaced.append((task, release))
+            else:
+                placed.append((space.take(i, duration), duration, task, release))
+        placed.sort(key=itemgetter(0))
+        self._placed = kept + placed
+        self._unplaced = unplaced
+        self._placement = None
+
+    @_timed("get_free_time")
+    def get_free_time(self, after, before=None):
         """Return a datetime.timedelta of the free time between two dates in this schedule.
 
         after -- datetime.datetime after which looking for free time
-        before -- datetime.datetime before which looking for free time
+        before -- datetime.datetime before which looking for free time (default to the end of the Schedule)
         """
         if before == None: before = self._end
-        #time to invest overall minus free time after "before"
-        if before < self._end:
-            return self.get_free_time(start, self._end) - self.get_free_time(end, self._end)
-        free_time = timedelta(0)
-        for i, occ in enumerate(self._timeline):
-            if occ._start+occ._duration >= after:
-                if i < len(self._timeline)-1:
-                    free_time += (self._timeline[i+1]._start - (occ._start+occ._duration)) if (self._timeline[i+1]._start > occ._start+occ._duration) else timedelta(0)
-                else:
-                    free_time += before - (occ._start+occ._duration) if before > occ._start+occ._duration else timedelta(0)
-        return free_time
+        if before <= after:
+            return timedelta(0)
+        self._ensure(after, before)
+        index = self._get_index()
+        a, b, s = _to_us(after), _to_us(before), _to_us(self._start)
+        #nothing is busy before the start, where an advanced Schedule may still hold occurrences it dropped
+        return timedelta(microseconds=(b - a) - (index.busy_until(max(b, s)) - index.busy_until(max(a, s))))
 
+    @_timed("get_free_times")
+    def get_free_times(self, windows):
+        """Return a list of datetime.timedelta of the free time in many windows at once.
+
+        windows -- iterable of tuples (after, before) of datetime.datetime
+        """
+        windows = list(windows)
+        if not windows:
+            return list()
+        afters, befores = [_to_us(a) for a, b in windows], [_to_us(b) for a, b in windows]
+        #one expansion covering every window rather than one per window
+        self._ensure(_from_us(min(afters)), _from_us(max(befores)))
+        return [timedelta(microseconds=us) for us in self._get_index().free_times(afters, befores, _to_us(self._start))]
+
+    @_timed("get_free_intervals")
     def get_free_intervals(self, after, before=None):
         """Return a list of tuples (datetime.datetime, datetime.datetime) representing the intervals of free time of this schedule.
 
         after -- datetime.datetime after which looking for free time
-        before -- datetime.datetime before which looking for free time
+        before -- datetime.datetime before which looking for free time (default to the end of the Schedule)
         """
-        intervals = list()
-        #entire list of intervals
-        for i, occ in enumerate(self._timeline):
-                if i < len(self._timeline)-1:
-                    if occ._start+occ._duration < self_timeline[i+1]._start:
-                        intervals.append(tuple((occ._start+occ._duration, self_timeline[i+1]._start))) 
-                else:
-                    if before > occ._start+occ._duration:
-                        intervals.append(tuple((occ._start+occ._duration, before)))
-        
-        #cutting before start and after end
-        for i, t in enumerate(intervals):
-            if t[1] <= after:
-                trimstart = i
-            elif trimend != None and t[0] >= before:
-                trimend = i
-        del intervals[:trimstart+1]
-        del intervals[trimend+1:]
-
-        #trimming first and last if needed
-        if intervals[0][0] > after and intervals[0][1] < after:
-            intervals.insert(1, tuple((after, intervals[0][1])))
-            del intervals[0]
-        if intervals[-1][1] > before and intervals[-1][0] < before:
-            intervals.append(tuple((intervals[-1][0], before)))
-            del intervals[-2]
+        if before == None: before = self._end
+        if before <= after:
+            return list()
+        self._ensure(after, before)
+        return [(_from_us(s), _from_us(e)) for s, e in self._free_intervals(_to_us(after), _to_us(before))]
+
+    def _free_intervals(self, after, before):
+        """Return the list of the free intervals (start, end) inside [after, before), in microseconds since the epoch.
 
+        The windows the interval can see must be expanded already.
+        """
+        start = _to_us(self._start)
+        if before <= start:
+            return [(after, before)]
+        intervals = self._get_index().free_intervals(max(after, start), before)
+        #the time before the start is free
+        if after < start:
+            if intervals and intervals[0][0] == start:
+                intervals[0] = (after, intervals[0][1])
+            else:
+                intervals.insert(0, (after, start))
         return intervals
 
+    @_timed("get_availability")
+    def get_availability(self, after, before=None, slot=timedelta(0, 900)):
+        """Return the Availability grid of the slots of a given length between two dates, telling which ones are free.
+
+        A slot is free when no occurrence overlaps it. Only whole slots fit in the grid: the time left at the end is dropped.
+
+        after -- datetime.datetime where the first slot starts
+        before -- datetime.datetime before which the last slot ends (default to the end of the Schedule)
+        slot -- datetime.timedelta of the length of the slots (default to 15 minutes)
+        """
+        if before == None: before = self._end
+        a, length = _to_us(after), slot // _US
+        if length <= 0:
+            raise ValueError("slot length must be positive")
+        size = max(_to_us(before) - a, 0) // length
+        if size == 0:
+            return Availability(after, slot, 0, 0)
+        b = a + size * length
+        self._ensure(after, _from_us(b))
+        #one character per slot, the last slot first as in the binary writing of the grid
+        free = bytearray(b"0") * size
+        for s, e in self._free_intervals(a, b):
+            lo, hi = size - (e - a) // length, size - -(-(s - a) // length)
+            if lo < hi:
+                free[lo:hi] = b"1" * (hi - lo)
+        return Availability(after, slot, size, int(free, 2))
+
+    @_timed("overlapping")
+    def overlapping(self, after, before):
+        """Return the list of the Occurrences overlapping the interval between two dates, sorted by start.
+
+        after -- datetime.datetime where the interval starts
+        before -- datetime.datetime where the interval ends
+        """
+        self._ensure(after, before)
+        index, timeline = self._get_index(), self._timeline
+        a, b = _to_us(after), _to_us(before)
+        occurrences = list()
+        for i in index.blocks(a, b):
+            for j in range(max(index._first[i], timeline._head), index._first[i+1]):
+                if timeline._starts[j] < b and timeline._ends[j] > a:
+                    occurrences.append(timeline._occurrence(j))
+        return occurrences
+
+    def conflicts(self, after=None, before=None, first=False):
+        """Yield the groups of Occurrences overlapping each other between two dates, as lists sorted by start.
+
+        A group holds every occurrence chained to another by an overlap: occurrences that only touch do not conflict.
+        The timeline being sorted by start, one sweep finds them, and only the busy blocks of more than one occurrence
+        are swept.
+
+        after -- datetime.datetime where looking for conflicts starts (default to the start of the Schedule)
+        before -- datetime.datetime where looking for conflicts ends (default to the end of the Schedule)
+        first -- stop at the first group, to validate a calendar quickly
+        """
+        if after == None: after = self._start
+        if before == None: before = self._end
+        self._ensure(after, before)
+        index, timeline = self._get_index(), self._timeline
+        starts, ends = timeline._starts, timeline._ends
+        a, b = _to_us(after), _to_us(before)
+        for i in index.blocks(a, b):
+            lo, hi = max(index._first[i], timeline._head), index._first[i+1]
+            if hi - lo < 2:
+                continue
+            group, reach = list(), None
+            #one past the end of the block closes its last group
+            for j in range(lo, hi + 1):
+                if j < hi and (starts[j] >= b or ends[j] <= a):
+                    continue
+                if j < hi and group and starts[j] < reach:
+                    group.append(j)
+                    reach = max(reach, ends[j])
+                    continue
+                if len(group) > 1:
+                    yield [timeline._occurrence(k) for k in group]
+                    if first:
+                        return
+                if j < hi:
+                    group, reach = [j], ends[j]
+
+def _busy_boundaries(index, after, before):
+    """Yield the (date, +1) starts and (date, -1) ends of the busy blocks of an index inside [after, before), sorted."""
+    for i in index.blocks(after, before):
+        start, end = max(index._starts[i], after), min(index._ends[i], before)
+        if start < end:
+            yield start, 1
+            yield end, -1
+
+
+def find_common_slots(schedules, duration, after, before, limit=None, max_busy=0):
+    """Return the list of the intervals (start, end) at least some duration long when the Schedules are free together.
+
+    The busy blocks of every Schedule are swept at once with a heap, stopping as soon as enough slots are found.
+
+    schedules -- list of Schedules to find a common slot in
+    duration -- datetime.timedelta the slots must last at least
+    after -- datetime.datetime after which looking for slots
+    before -- datetime.datetime before which looking for slots
+    limit -- maximal number of slots to return, at least 1 (default to all of them)
+    max_busy -- number of Schedules allowed to be busy during a slot, for quorums
+    """
+    if limit != None and limit < 1:
+        raise ValueError("limit must be at least 1, not {}".format(limit))
+    a, b, length = _to_us(after), _to_us(before), duration // _US
+    streams = list()
+    for s in schedules:
+        s._ensure(after, before)
+        streams.append(_busy_boundaries(s._get_index(), max(a, _to_us(s._start)), b))
+    slots = list()
+    busy, free_from = 0, a
+    #ends sort before starts at the same date, so back to back blocks leave no gap
+    for date, delta in heapq.merge(*streams):
+        busy += delta
+        if delta > 0 and busy == max_busy + 1:
+            if date > free_from and date - free_from >= length:
+                slots.append((_from_us(free_from), _from_us(date)))
+                if len(slots) == limit:
+                    return slots
+        elif delta < 0 and busy == max_busy:
+            free_from = date
+    if busy <= max_busy and b > free_from and b - free_from >= length:
+        slots.append((_from_us(free_from), _from_us(b)))
+    return slots
+
+
+def _pack_event(event):
+    """Return an Event as a compact picklable tuple, its recurrence as an RFC 5545 string."""
+    return (event._title, event._description, _to_us(event._start), event._duration // _US,
+            None if event._repeating == None else str(event._repeating))
+
+
+def _pack_task(task):
+    """Return a Task as a compact picklable tuple."""
+    return _pack_event(task) + (task._priority, _to_us(task._due))
+
+
+@lru_cache(maxsize=4096)
+def _parse_rule(rule):
+    """Return the rrule of a string, parsing every distinct one once per process."""
+    return rrulestr(rule)
+
+
+def _unpack_event(packed):
+    """Build the Event of a tuple given by _pack_event."""
+    title, description, start, duration, rule = packed
+    return Event(title, description, _from_us(start), timedelta(microseconds=duration), None if rule == None else _parse_rule(rule))
+
+
+def _unpack_task(packed):
+    """Build the Task of a tuple given by _pack_task."""
+    title, description, start, duration, rule, priority, due = packed
+    return Task(title, description, _from_us(start), timedelta(microseconds=duration), priority, _from_us(due),
+                None if rule == None else _parse_rule(rule))
+
+
+#binary format: a header then sections of little-endian int64, strings being indices in a string table
+_MAGIC = b"OTTOSCHD"
+_FORMAT_VERSION = 1
+#magic, version, start, end, window, strings, events, tasks, recurring events, expanded windows, occurrences
+_HEADER = struct.Struct("<8s10q")
+
+
+def _little(column):
+    """Return an array of int64 in little-endian byte order."""
+    if sys.byteorder == "little":
+        return column
+    swapped = array('q', column)
+    swapped.byteswap()
+    return swapped
+
+
+def save_schedule(schedule, path):
+    """Write a Schedule and its expanded timeline to a binary file, for load_schedule.
+
+    Occurrences are written as fixed-width records straight from the timeline, so nothing is expanded again on load.
+
+    schedule -- Schedule to write
+    path -- path of the file to write
+    """
+    timeline = schedule._timeline
+    #the timeline's event table comes first so its id column is written as it is
+    events, ids = list(timeline._events), dict(timeline._ids_of)
+    for e in schedule._recurring:
+        if e not in ids:
+            ids[e] = len(events)
+            events.append(e)
+    strings = dict()
+    def record(packed):
+        title, description, start, duration, rule = packed[:5]
+        return (strings.setdefault(title, len(strings)), strings.setdefault(description, len(strings)), start, duration,
+                -1 if rule == None else strings.setdefault(rule, len(strings))) + packed[5:]
+    event_records, task_records = array('q'), array('q')
+    for e in events:
+        event_records.extend(record(_pack_event(e)))
+    for t in schedule._tasks:
+        task_records.extend(record(_pack_task(t)))
+    encoded = [s.encode() for s in strings]
+    offsets = array('q', accumulate([0] + [len(b) for b in encoded]))
+    blob = b"".join(encoded)
+    blob += bytes(-len(blob) % 8) #keeps the next sections aligned
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, _to_us(schedule._start), _to_us(schedule._end), schedule._cache._window // _US,
+                          len(encoded), len(events), len(schedule._tasks), len(schedule._recurring), len(schedule._expanded), len(timeline))
+    sections = (offsets, event_records, task_records, array('q', (ids[e] for e in schedule._recurring)),
+                array('q', sorted(schedule._expanded)), timeline._starts[timeline._head:], timeline._ends[timeline._head:],
+                timeline._ids[timeline._head:])
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(_little(sections[0]))
+        f.write(blob)
+        for section in sections[1:]:
+            f.write(_little(section))
+
+
+def load_schedule(path):
+    """Read a Schedule written by save_schedule.
+
+    The file is mapped in memory and the timeline columns are views on it: they are only copied when the timeline changes.
+
+    path -- path of the file to read
+    """
+    with open(path, "rb") as f:
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if len(view) < _HEADER.size or view[:len(_MAGIC)] != _MAGIC:
+        raise ValueError("{} is not a Schedule file".format(path))
+    _, version, start, end, window, n_strings, n_events, n_tasks, n_recurring, n_windows, n_occurrences = _HEADER.unpack_from(view)
+    if version != _FORMAT_VERSION:
+        raise ValueError("unsupported Schedule file version {}".format(version))
+    position = _HEADER.size
+    def section(count):
+        nonlocal position
+        column = view[position:position + 8 * count].cast('q')
+        position += 8 * count
+        return column if sys.byteorder == "little" else _little(column)
+    offsets = section(n_strings + 1)
+    blob = view[position:position + offsets[-1]]
+    position += offsets[-1] + -offsets[-1] % 8
+    strings = [str(blob[a:b], "utf-8") for a, b in zip(offsets, offsets[1:])]
+    def packed(records, width, i):
+        title, description, first, duration, rule = records[width*i:width*i + 5]
+        return (strings[title], strings[description], first, duration, None if rule < 0 else strings[rule]) + tuple(records[width*i + 5:width*(i+1)])
+    event_records, task_records = section(5 * n_events), section(7 * n_tasks)
+    events = [_unpack_event(packed(event_records, 5, i)) for i in range(n_events)]
+    tasks = [_unpack_task(packed(task_records, 7, i)) for i in range(n_tasks)]
+    recurring, windows = section(n_recurring), section(n_windows)
+
+    schedule = Schedule(list(), tasks, _from_us(start))
+    schedule._end = _from_us(end)
+    schedule._recurring = [events[i] for i in recurring]
+    schedule._reach = max((e._duration for e in schedule._recurring), default=timedelta(0))
+    timeline = schedule._timeline
+    timeline._starts, timeline._ends, timeline._ids = section(n_occurrences), section(n_occurrences), section(n_occurrences)
+    timeline._events, timeline._ids_of = events, {e: i for i, e in enumerate(events)}
+    if window == schedule._cache._window // _US:
+        schedule._expanded = set(windows)
+    else:
+        #windows of another length do not line up: expand the recurring events again
+        for e in schedule._recurring:
+            timeline.remove(e)
+    return schedule
+
+
+def packed_placement(schedule):
+    """Return the task placement of a Schedule as compact tuples.
+
+    Return a tuple (placed, unplaced): placed is the list of the tuples (task position, start, duration),
+    unplaced the list of the tuples (task position, release), positions in the task list the Schedule was built with
+    and dates in microseconds since the epoch.
+    """
+    positions = {t: i for i, t in enumerate(schedule._tasks)}
+    placed, unplaced = schedule.place_tasks()
+    return ([(positions[o._event], _to_us(o._start), o._duration // _US) for o in placed],
+            [(positions[t], _to_us(r)) for t, r in unplaced])
+
+
+def _solve_chunk(chunk, solve):
+    """Build and solve the Schedules of a chunk of packed inputs in a worker process."""
+    results = list()
+    for position, events, tasks, start in chunk:
+        schedule = Schedule([_unpack_event(e) for e in events], [_unpack_task(t) for t in tasks],
+                            None if start == None else _from_us(start))
+        results.append((position, solve(schedule)))
+    return results
+
+
+def schedule_many(inputs, solve=packed_placement, chunksize=16, max_workers=None):
+    """Build and solve many Schedules across a pool of processes, yielding the tuples (position, result) as they finish.
+
+    inputs -- iterable of tuples (events, tasks, start) as given to Schedule
+    solve -- picklable function giving the result of a Schedule (default to its packed task placement)
+    chunksize -- number of Schedules sent to a worker process at once
+    max_workers -- number of worker processes (default to the number of processors)
+    """
+    packed = ((i, [_pack_event(e) for e in events], [_pack_task(t) for t in tasks], None if start == None else _to_us(start))
+              for i, (events, tasks, start) in enumerate(inputs))
+    chunks = iter(lambda: list(islice(packed, chunksize)), [])
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        #a few chunks in flight per worker keep them busy without packing every input up front
+        pending = set(pool.submit(_solve_chunk, c, solve) for c in islice(chunks, 2 * workers))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+            pending.update(pool.submit(_solve_chunk, c, solve) for c in islice(chunks, len(done)))
+
+
 #tests
 if __name__ == "__main__":
     print(str(Task("a task", "description of it", datetime.now(), timedelta(0,360), 99, datetime.now()+timedelta(1), rrule(DAILY, dtstart=datetime.now()))))
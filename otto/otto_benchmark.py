@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+from dateutil.rrule import rrule, MINUTELY, HOURLY, DAILY
+import otto
+from otto import Event, Task, Schedule, schedule_many
+from otto_ical import read_ics, write_ics
+
+
+def synthetic_calendar(occurrences, events=10, start=datetime(2016, 1, 1)):
+    """Return (events, tasks, start) producing about that many occurrences.
+
+    occurrences -- int total number of occurrences wanted in the timeline
+    events -- int number of hourly recurring events sharing them
+    start -- datetime.datetime of beginning of the calendar
+    """
+    hours = occurrences // events
+    evs = [Event("event {}".format(i), "hourly", start, timedelta(0, 60),
+                 rrule(HOURLY, dtstart=start + timedelta(0, 60 * i)))
+           for i in range(events)]
+    tasks = [Task("horizon", "due at the end", start, timedelta(0, 60), 50, start + timedelta(0, 3600 * hours - 1))]
+    return evs, tasks, start
+
+
+def generate_calendar(events, recurring=0.5, density=1, tasks=100, horizon=365, seed=0, start=datetime(2016, 1, 1)):
+    """Return (events, tasks, start) of a random calendar.
+
+    events -- int number of events
+    recurring -- float share of the events that are recurring
+    density -- float average number of occurrences per day of a recurring event
+    tasks -- int number of tasks, due within a week of their release
+    horizon -- int number of days the events and tasks are spread over
+    seed -- seed of the random generator, for the same parameters to give the same calendar
+    """
+    rand = random.Random(seed)
+    date = lambda: start + timedelta(0, 60 * rand.randrange(horizon * 24 * 60))
+    evs = list()
+    for i in range(events):
+        d, duration = date(), timedelta(0, 60 * rand.choice((15, 30, 60, 120)))
+        if rand.random() < recurring:
+            evs.append(Event("event {}".format(i), "recurring", d, duration, rrule(MINUTELY, dtstart=d, interval=max(round(1440 / density), 1))))
+        else:
+            evs.append(Event("event {}".format(i), "once", d, duration))
+    evs.sort(key=lambda e: e._start)
+    tsks = list()
+    for i in range(tasks):
+        d = date()
+        tsks.append(Task("task {}".format(i), "random", d, timedelta(0, 60 * rand.choice((15, 30, 60))), rand.randrange(100), d + timedelta(rand.randint(1, 7))))
+    tsks.sort(key=lambda t: t._start)
+    return evs, tsks, start
+
+
+def fixture_calendar():
+    """Return (events, tasks, start) of the sleep, resting and medical appointment fixtures of otto_unittest."""
+    from otto_unittest import TestScheduleMethods
+    fixture = TestScheduleMethods()
+    fixture.setup()
+    return sorted(fixture.events_list, key=lambda e: e._start), sorted(fixture.tasks_list, key=lambda t: t._start), datetime(2016, 2, 22)
+
+
+def percentile(values, p):
+    """Return the nearest-rank p-th percentile of a list of values."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def bench_calendar(events, tasks, start, queries=200, seed=0):
+    """Return a dict of the measures of a calendar: build time, occurrences per second, query latencies and peak memory.
+
+    Times are in seconds, and the latencies are the 50th and 99th percentiles of queries over random days of the Schedule.
+    """
+    rand = random.Random(seed)
+    t0 = time.perf_counter()
+    s = Schedule(events, tasks, start)
+    s._ensure(s._start, s._end)
+    build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    s._get_index()
+    index = time.perf_counter() - t0
+    days = max((s._end - s._start).days, 1)
+    windows = [(w, w + timedelta(1)) for w in (s._start + timedelta(rand.randrange(days)) for i in range(queries))]
+    measures = {"occurrences": len(s._timeline), "build_s": build, "occurrences_per_s": len(s._timeline) / build, "index_s": index}
+    for name, query in (("free_time", s.get_free_time), ("free_intervals", s.get_free_intervals)):
+        latencies = list()
+        for after, before in windows:
+            t0 = time.perf_counter()
+            query(after, before)
+            latencies.append(time.perf_counter() - t0)
+        measures[name + "_p50_s"], measures[name + "_p99_s"] = percentile(latencies, 50), percentile(latencies, 99)
+    t0 = time.perf_counter()
+    s.place_tasks()
+    measures["place_s"] = time.perf_counter() - t0
+    event = Event("added", "daily", s._start, timedelta(0, 3600), rrule(DAILY, dtstart=s._start + timedelta(0, 3600 * 13)))
+    t0 = time.perf_counter()
+    s.add_event(event)
+    measures["add_event_s"] = time.perf_counter() - t0
+    #tracing allocations slows everything down: memory is measured on a build of its own
+    tracemalloc.start()
+    s = Schedule(events, tasks, start)
+    s._ensure(s._start, s._end)
+    s._get_index()
+    measures["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return measures
+
+
+#name -> parameters of generate_calendar
+SUITE = {"small": dict(events=100, recurring=0.5, density=1, tasks=100, horizon=90),
+         "busy": dict(events=100, recurring=1.0, density=24, tasks=1000, horizon=365),
+         "large": dict(events=2000, recurring=0.5, density=2, tasks=2000, horizon=365)}
+
+
+def run_suite(suite=SUITE):
+    """Return the results of a benchmark suite, with the fixture scenario, as a dict ready to be saved in JSON."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    cases = dict()
+    for name, parameters in suite.items():
+        cases[name] = dict(parameters, **bench_calendar(*generate_calendar(**parameters)))
+    cases["fixtures"] = bench_calendar(*fixture_calendar())
+    return {"commit": commit, "date": datetime.now().isoformat(), "python": platform.python_version(),
+            "numpy": otto.numpy != None, "cases": cases}
+
+
+def compare(previous, current, threshold=1.2, floor=1e-3):
+    """Yield the tuples (case, measure, previous, current) of the times and memory that grew by more than a ratio,
+    and of the throughputs that fell by more than it.
+
+    Growths of the memory and of the whole run times smaller than the floor (in megabytes or seconds) are noise
+    and ignored, while the query latency percentiles, far smaller than it, are compared by their ratio alone.
+    """
+    for case, measures in current["cases"].items():
+        for measure, value in measures.items():
+            old = previous["cases"].get(case, dict()).get(measure)
+            if not old:
+                continue
+            if measure.endswith("_per_s"):
+                if value < old / threshold:
+                    yield case, measure, old, value
+            elif measure.endswith("_p50_s") or measure.endswith("_p99_s"):
+                if value > old * threshold:
+                    yield case, measure, old, value
+            elif (measure.endswith("_s") or measure.endswith("_mb")) and value > old * threshold and value - old > floor:
+                yield case, measure, old, value
+
+
+def bench_build(occurrences):
+    """Return (seconds, timeline length) of building a Schedule of that many occurrences and expanding all of them."""
+    events, tasks, start = synthetic_calendar(occurrences)
+    t0 = time.perf_counter()
+    s = Schedule(events, tasks, start)
+    s.get_free_time(start)
+    return time.perf_counter() - t0, len(s._timeline)
+
+
+def bench_place(count, days=365, start=datetime(2016, 1, 1)):
+    """Return (seconds, placed, unplaced) of placing that many tasks over a horizon of some days."""
+    rand = random.Random(0)
+    events = [Event("sleep", "every night", start, timedelta(0, 8*3600), rrule(DAILY, dtstart=start + timedelta(0, 22*3600)))]
+    tasks = list()
+    for i in range(count):
+        release = start + timedelta(0, 60 * rand.randrange(days * 24 * 60))
+        tasks.append(Task("task {}".format(i), "random", release, timedelta(0, 60 * rand.choice((15, 30, 60, 120))),
+                          rand.randrange(100), release + timedelta(rand.randint(1, 30))))
+    s = Schedule(events, tasks, start)
+    s.get_free_time(start)
+    t0 = time.perf_counter()
+    placed, unplaced = s.place_tasks()
+    return time.perf_counter() - t0, len(placed), len(unplaced)
+
+
+def bench_many(people, workers=None, chunksize=16, start=datetime(2016, 1, 1)):
+    """Return the seconds taken to build and place the tasks of a month-long Schedule per person across a process pool."""
+    rand = random.Random(0)
+    inputs = list()
+    for p in range(people):
+        events = [Event("sleep", "every night", start, timedelta(0, 8*3600), rrule(DAILY, dtstart=start + timedelta(0, 3600 * rand.choice((21, 22, 23)))))]
+        tasks = [Task("task {}".format(i), "random", start + timedelta(rand.randrange(28)), timedelta(0, 60 * rand.choice((15, 30, 60))),
+                      rand.randrange(100), start + timedelta(30)) for i in range(50)]
+        inputs.append((events, tasks, start))
+    t0 = time.perf_counter()
+    for position, result in schedule_many(inputs, chunksize=chunksize, max_workers=workers):
+        pass
+    return time.perf_counter() - t0
+
+
+def bench_ical(megabytes, start=datetime(2016, 1, 1)):
+    """Return (seconds written, seconds read, components) of exporting then importing an iCalendar of that many megabytes."""
+    rand = random.Random(0)
+    sample = list()
+    for i in range(4000):
+        date = start + timedelta(0, 60 * rand.randrange(365 * 24 * 60))
+        if i % 4 == 0:
+            sample.append(Task("task {}".format(i), "random, with a longer description", date, timedelta(0, 1800), rand.randrange(100), date + timedelta(7)))
+        elif i % 4 == 1:
+            sample.append(Event("event {}".format(i), "weekly", date, timedelta(0, 3600), rrule(DAILY, dtstart=date, interval=7)))
+        else:
+            sample.append(Event("event {}".format(i), "once", date, timedelta(0, 3600)))
+    def items(f):
+        #the same sample over and over until the file is large enough
+        while f.tell() < megabytes * 2**20:
+            yield from sample
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "calendar.ics")
+        t0 = time.perf_counter()
+        with open(path, "w", newline="") as f:
+            count = write_ics(f, items(f))
+        t1 = time.perf_counter()
+        with open(path, newline="") as f:
+            for item in read_ics(f):
+                pass
+        return t1 - t0, time.perf_counter() - t1, count
+
+
+#usage: otto_benchmark.py [occurrences...] | otto_benchmark.py --suite [--json results.json] [--compare previous.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks of otto")
+    parser.add_argument("sizes", nargs="*", type=int, help="numbers of occurrences to build")
+    parser.add_argument("--suite", action="store_true", help="run the benchmark suite instead")
+    parser.add_argument("--json", help="file to save the results of the suite to")
+    parser.add_argument("--compare", help="results of a previous suite to compare with")
+    args = parser.parse_args()
+    if args.suite:
+        results = run_suite()
+        for case, measures in results["cases"].items():
+            print("{0:>9}: {1[occurrences]} occurrences built in {1[build_s]:.3f}s ({1[occurrences_per_s]:.0f} occ/s), "
+                  "free time p50/p99 {2:.1f}/{3:.1f}us, free intervals p50/p99 {4:.1f}/{5:.1f}us, placed in {1[place_s]:.3f}s, "
+                  "peak {1[peak_mb]:.1f}MB".format(case, measures, 1e6 * measures["free_time_p50_s"], 1e6 * measures["free_time_p99_s"],
+                                                   1e6 * measures["free_intervals_p50_s"], 1e6 * measures["free_intervals_p99_s"]))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                previous = json.load(f)
+            for case, measure, old, new in compare(previous, results):
+                print("regression since {0}: {1} {2} {3:.4g} -> {4:.4g}".format(previous["commit"][:10], case, measure, old, new))
+        sys.exit()
+    sizes = args.sizes or [10000, 100000, 1000000]
+    for n in sizes:
+        seconds, length = bench_build(n)
+        print("{0:>9} occurrences: built in {1:.3f}s ({2:.0f} occ/s)".format(length, seconds, length / seconds))
+    seconds, placed, unplaced = bench_place(10000)
+    print("{0:>9} tasks over a year: placed in {1:.3f}s ({2} placed, {3} unplaced)".format(10000, seconds, placed, unplaced))
+    for workers in sorted({1, os.cpu_count() or 1}):
+        seconds = bench_many(1000, workers)
+        print("{0:>9} Schedules on {1} processes: solved in {2:.3f}s ({3:.0f} Schedules/s)".format(1000, workers, seconds, 1000 / seconds))
+    written, read, count = bench_ical(100)
+    print("{0:>9} MB iCalendar: written in {1:.3f}s, read in {2:.3f}s ({3} components)".format(100, written, read, count))
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from dateutil.rrule import rrule, weekday, YEARLY, MONTHLY, WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY
+from otto import Event, Task, Occurrence
+
+
+_FREQUENCIES = {"YEARLY": YEARLY, "MONTHLY": MONTHLY, "WEEKLY": WEEKLY, "DAILY": DAILY,
+                "HOURLY": HOURLY, "MINUTELY": MINUTELY, "SECONDLY": SECONDLY}
+_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+_LISTS = {"BYMONTH": "bymonth", "BYMONTHDAY": "bymonthday", "BYYEARDAY": "byyearday", "BYWEEKNO": "byweekno",
+          "BYHOUR": "byhour", "BYMINUTE": "byminute", "BYSECOND": "bysecond", "BYSETPOS": "bysetpos"}
+_DURATION = re.compile(r"([-+]?)P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_ESCAPED = re.compile(r"\\(.)")
+_TO_ESCAPE = re.compile(r"([\\;,\n])")
+
+
+def _unfold(lines):
+    """Yield the logical lines of an iCalendar, joining the folded ones."""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if current != None:
+                current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _split(line):
+    """Return the (name, value) of a content line, dropping its parameters."""
+    colon = line.find(":")
+    if colon < 0:
+        return line.upper(), ""
+    if '"' in line[:colon]:
+        #a quoted parameter value may hold a colon
+        quoted = False
+        for colon, c in enumerate(line):
+            if c == '"':
+                quoted = not quoted
+            elif c == ":" and not quoted:
+                break
+    return line[:colon].split(";", 1)[0].upper(), line[colon+1:]
+
+
+def _unescape(text):
+    """Return a TEXT value without its escapes."""
+    if "\\" not in text:
+        return text
+    return _ESCAPED.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+
+def _parse_date(value):
+    """Return the datetime.datetime of a DATE or DATE-TIME value, UTC ones included as naive datetimes."""
+    if len(value) == 8:
+        return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]), int(value[9:11]), int(value[11:13]), int(value[13:15]))
+
+
+def _parse_duration(value):
+    """Return the datetime.timedelta of a DURATION value."""
+    match = _DURATION.match(value)
+    if match == None:
+        raise ValueError("invalid DURATION {}".format(value))
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+
+@lru_cache(maxsize=4096)
+def _rule_options(value):
+    """Return the (frequency, options) of an RRULE value for dateutil.rrule.rrule, parsing every distinct one once."""
+    frequency, options = None, dict()
+    for part in value.split(";"):
+        key, _, item = part.partition("=")
+        key = key.upper()
+        if key == "FREQ":
+            frequency = _FREQUENCIES[item.upper()]
+        elif key in ("INTERVAL", "COUNT"):
+            options[key.lower()] = int(item)
+        elif key == "UNTIL":
+            options["until"] = _parse_date(item)
+        elif key == "WKST":
+            options["wkst"] = _WEEKDAYS[item.upper()]
+        elif key == "BYDAY":
+            options["byweekday"] = tuple(weekday(_WEEKDAYS[d[-2:].upper()], int(d[:-2]) if d[:-2] not in ("", "+") else None)
+                                         for d in item.split(","))
+        elif key in _LISTS:
+            options[_LISTS[key]] = tuple(int(i) for i in item.split(","))
+        else:
+            raise ValueError("unsupported RRULE part {}".format(part))
+    if frequency == None:
+        raise ValueError("RRULE without FREQ: {}".format(value))
+    return frequency, options
+
+
+def _build(kind, properties):
+    """Return the Event of a VEVENT or the Task of a VTODO from its properties, None if it cannot be scheduled."""
+    start, due = properties.get("DTSTART"), properties.get("DUE")
+    if kind == "VEVENT" and start == None or kind == "VTODO" and due == None:
+        return None
+    title, description = _unescape(properties.get("SUMMARY", "")), _unescape(properties.get("DESCRIPTION", ""))
+    start = datetime.min if start == None else _parse_date(start)
+    if "X-OTTO-DURATION" in properties:
+        duration = _parse_duration(properties["X-OTTO-DURATION"])
+    elif "DURATION" in properties:
+        duration = _parse_duration(properties["DURATION"])
+    elif "DTEND" in properties:
+        duration = _parse_date(properties["DTEND"]) - start
+    else:
+        #a day long event happens on its date, any other one is instantaneous
+        duration = timedelta(1) if kind == "VEVENT" and len(properties["DTSTART"]) == 8 else timedelta(0)
+    repeating = None
+    if "RRULE" in properties:
+        frequency, options = _rule_options(properties["RRULE"])
+        repeating = rrule(frequency, dtstart=start, **options)
+    #the start of the rule is the DTSTART, an item starting elsewhere keeps its own start
+    if "X-OTTO-START" in properties:
+        start = _parse_date(properties["X-OTTO-START"])
+    if kind == "VEVENT":
+        return Event(title, description, start, duration, repeating)
+    if "X-OTTO-PRIORITY" in properties:
+        priority = int(properties["X-OTTO-PRIORITY"])
+    else:
+        #iCalendar ranks from 1 (highest) to 9 (lowest), 0 being undefined
+        priority = int(properties.get("PRIORITY", 0))
+        priority = 10 - priority if priority > 0 else 0
+    return Task(title, description, start, duration, priority, _parse_date(due), repeating)
+
+
+def read_ics(lines):
+    """Yield the Events (from VEVENT) and Tasks (from VTODO) of an iCalendar one at a time, in constant memory.
+
+    Dates are read as naive datetimes, UTC ones and ones with a TZID alike. RDATE and EXDATE are not supported.
+    VEVENTs without DTSTART and VTODOs without DUE are skipped.
+
+    lines -- iterable of the lines of an iCalendar, like a file opened in text mode
+    """
+    kind, properties, nested = None, None, 0
+    for line in _unfold(lines):
+        name, _, value = line.partition(":")
+        if ";" in name:
+            name, value = _split(line)
+        else:
+            name = name.upper()
+        if name == "BEGIN":
+            if kind != None:
+                nested += 1 #alarms and the like inside a component
+            elif value.upper() in ("VEVENT", "VTODO"):
+                kind, properties = value.upper(), dict()
+        elif name == "END":
+            if nested:
+                nested -= 1
+            elif kind != None and value.upper() == kind:
+                item = _build(kind, properties)
+                if item != None:
+                    yield item
+                kind, properties = None, None
+        elif kind != None and not nested:
+            properties.setdefault(name, value)
+
+
+def _escape(text):
+    """Return a string as a TEXT value."""
+    return _TO_ESCAPE.sub(lambda m: "\\n" if m.group(1) == "\n" else "\\" + m.group(1), text)
+
+
+def _format_date(date):
+    """Return a datetime.datetime as a floating DATE-TIME value."""
+    return "{:04d}{:02d}{:02d}T{:02d}{:02d}{:02d}".format(date.year, date.month, date.day, date.hour, date.minute, date.second)
+
+
+def _format_duration(duration):
+    """Return a datetime.timedelta as a DURATION value."""
+    if duration < timedelta(0):
+        return "-" + _format_duration(-duration)
+    return "P{}DT{}S".format(duration.days, duration.seconds)
+
+
+def _fold(line):
+    """Return a content line folded every 75 octets, with CRLF line breaks."""
+    if len(line) <= 75 and line.isascii():
+        return line + "\r\n"
+    parts, part, size = list(), "", 0
+    for c in line:
+        n = len(c.encode())
+        if size + n > 75:
+            parts.append(part)
+            part, size = " ", 1
+        part += c
+        size += n
+    parts.append(part)
+    return "\r\n".join(parts) + "\r\n"
+
+
+def _component(item, uid, stamp):
+    """Return the content lines of the VEVENT or VTODO of an Event, a Task or an Occurrence."""
+    if isinstance(item, Occurrence):
+        event, repeating = item._event, None
+    else:
+        event, repeating = item, item._repeating
+    #occurrences of a recurring item follow the start of its rule, which may not be the start of the item
+    start = item._start if repeating == None else repeating._dtstart
+    if isinstance(item, Task):
+        #a VTODO with a DUE has no DURATION
+        kind = "VTODO"
+        lines = ["BEGIN:VTODO", "DUE:" + _format_date(item._due), "X-OTTO-DURATION:" + _format_duration(item._duration),
+                 "PRIORITY:{}".format(min(max(10 - item._priority, 1), 9) if item._priority > 0 else 0),
+                 "X-OTTO-PRIORITY:{}".format(item._priority)]
+        if start != datetime.min:
+            lines.append("DTSTART:" + _format_date(start))
+    else:
+        kind = "VEVENT"
+        lines = ["BEGIN:VEVENT", "DTSTART:" + _format_date(start), "DTEND:" + _format_date(start + item._duration)]
+    if start != item._start:
+        lines.append("X-OTTO-START:" + _format_date(item._start))
+    lines += ["UID:" + uid, "DTSTAMP:" + stamp, "SUMMARY:" + _escape(event._title), "DESCRIPTION:" + _escape(event._description)]
+    if repeating != None:
+        lines += [l for l in str(repeating).splitlines() if l.startswith("RRULE:")]
+    lines.append("END:" + kind)
+    return lines
+
+
+def write_ics(stream, items):
+    """Write Events, Tasks and Occurrences to a text stream as an iCalendar, one component at a time.
+
+    Events become VEVENTs and Tasks VTODOs, with their RRULE. Occurrences, like the ones of a timeline or of placed tasks,
+    become unique VEVENTs. Return the number of components written.
+
+    stream -- text stream to write to, opened with newline="" to keep the CRLF line breaks
+    items -- iterable of Events, Tasks and Occurrences
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    stream.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//otto//otto//EN\r\n")
+    count = 0
+    for count, item in enumerate(items, 1):
+        stream.write("".join(_fold(l) for l in _component(item, "{}-{}@otto".format(stamp, count), stamp)))
+    stream.write("END:VCALENDAR\r\n")
+    return count
+
+
+def timeline_occurrences(schedule):
+    """Yield the Occurrences of the whole expanded timeline of a Schedule one at a time, sorted by start."""
+    schedule._ensure(schedule._start, schedule._end)
+    yield from schedule._timeline
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import asyncio
+import random
+import sys
+import time
+
+from datetime import datetime, timedelta
+from otto import Event
+from otto_benchmark import synthetic_calendar, percentile
+from otto_service import ScheduleService
+
+
+async def client(service, names, requests, start, rand, latencies):
+    """Send requests to the service one after the other, appending the latency of every one to a list.
+
+    Most requests are free time and free interval queries over one of a few days, so some of them are identical,
+    one in twenty adds then removes an event.
+    """
+    for i in range(requests):
+        name = rand.choice(names)
+        after = start + timedelta(rand.randrange(30))
+        t0 = time.perf_counter()
+        kind = rand.random()
+        if kind < 0.05:
+            event = Event("meeting", "load test", after + timedelta(0, 3600 * 9), timedelta(0, 3600))
+            await service.add_event(name, event)
+            await service.remove_event(name, event)
+        elif kind < 0.5:
+            await service.get_free_time(name, after, after + timedelta(1))
+        else:
+            await service.get_free_intervals(name, after, after + timedelta(1))
+        latencies.append(time.perf_counter() - t0)
+
+
+async def load_test(clients=100, requests=100, schedules=4, occurrences=20000, seed=0):
+    """Return (latencies in seconds, total seconds, coalesced queries) of concurrent clients querying a ScheduleService."""
+    rand = random.Random(seed)
+    service = ScheduleService()
+    names = ["schedule {}".format(i) for i in range(schedules)]
+    start = datetime(2016, 1, 1)
+    await asyncio.gather(*(service.build(n, *synthetic_calendar(occurrences, start=start)) for n in names))
+    latencies = list()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(service, names, requests, start, random.Random(rand.random()), latencies) for c in range(clients)))
+    return latencies, time.perf_counter() - t0, service.coalesced
+
+
+#usage: otto_loadtest.py [clients [requests per client]]
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    latencies, seconds, coalesced = asyncio.run(load_test(clients, requests))
+    print("{0} requests from {1} clients in {2:.3f}s ({3:.0f} requests/s, {4} queries coalesced)".format(
+        len(latencies), clients, seconds, len(latencies) / seconds, coalesced))
+    print("latency p50 {0:.2f}ms, p99 {1:.2f}ms, max {2:.2f}ms".format(
+        1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99), 1000 * max(latencies)))
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from otto import Schedule, load_schedule
+
+
+def _build(events, tasks, start, expand):
+    """Build a Schedule, expanding its whole timeline if asked to."""
+    schedule = Schedule(events, tasks, start)
+    if expand:
+        schedule._ensure(schedule._start, schedule._end)
+    return schedule
+
+
+class ScheduleService:
+    """Asyncio facade serving queries on named Schedules
+
+    Every call on a Schedule runs in an executor so the event loop is never blocked by a timeline walk,
+    and the calls on a same Schedule are serialized in the order they are made. Identical queries made while one is
+    computing share its result, unless a change was asked for in between.
+    """
+
+    def __init__(self, executor=None):
+        """Build a service without Schedules.
+
+        executor -- concurrent.futures.Executor running the calls on Schedules
+                    (default to a single thread, as every Schedule shares the occurrence cache)
+        """
+        self._executor = executor or ThreadPoolExecutor(max_workers=1)
+        self._schedules = dict() #name -> Schedule
+        self._locks = dict() #name -> asyncio.Lock serializing the calls on the Schedule
+        self._pending = dict() #(Schedule, changes asked for, method, arguments) -> task computing the query
+        self._changes = dict() #name -> number of changes asked for, applied or still waiting for the lock
+        self.coalesced = 0
+
+    def names(self):
+        """Return the list of the names of the Schedules served."""
+        return list(self._schedules)
+
+    async def _run(self, function, *args):
+        """Return the result of a function run in the executor."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(function, *args))
+
+    async def _set(self, name, schedule):
+        """Serve a Schedule under a name, once the calls on the Schedule it replaces are done."""
+        async with self._locks.setdefault(name, asyncio.Lock()):
+            self._schedules[name] = schedule
+
+    async def build(self, name, events, tasks, start=None, expand=True):
+        """Build a Schedule in the executor and serve it under a name.
+
+        name -- name of the Schedule, replacing any Schedule of that name
+        events, tasks, start -- as given to Schedule
+        expand -- expand the whole timeline before serving the Schedule, for the first queries to be fast
+        """
+        await self._set(name, await self._run(_build, events, tasks, start, expand))
+
+    async def load(self, name, path):
+        """Load a Schedule saved by otto.save_schedule in the executor and serve it under a name."""
+        await self._set(name, await self._run(load_schedule, path))
+
+    async def drop(self, name):
+        """Stop serving a Schedule, once the calls on it are done."""
+        async with self._locks[name]:
+            del self._schedules[name]
+
+    async def _call(self, schedule, name, method, args):
+        """Call a method of a Schedule in the executor once the calls made on it before are done."""
+        async with self._locks[name]:
+            return await self._run(getattr(schedule, method), *args)
+
+    async def _query(self, name, method, *args):
+        """Return the result of a query on a Schedule, sharing the one of an identical query still computing."""
+        schedule = self._schedules[name]
+        #a query made after a change was asked for does not share the result of one made before,
+        #even while the change still waits for its turn
+        key = (schedule, self._changes.get(name, 0), method, args)
+        task = self._pending.get(key)
+        if task != None:
+            self.coalesced += 1
+        else:
+            task = self._pending[key] = asyncio.ensure_future(self._call(schedule, name, method, args))
+            task.add_done_callback(lambda t: self._pending.pop(key, None))
+        #a caller giving up does not cancel the query of the others
+        return await asyncio.shield(task)
+
+    async def _mutate(self, name, method, *args):
+        """Apply a change to a Schedule and return its result."""
+        self._changes[name] = self._changes.get(name, 0) + 1
+        #a task like the queries, for the lock to be asked for in the order the calls were made
+        return await asyncio.ensure_future(self._call(self._schedules[name], name, method, args))
+
+    async def get_free_time(self, name, after, before=None):
+        """Return the datetime.timedelta of the free time between two dates in a Schedule, see Schedule.get_free_time."""
+        return await self._query(name, "get_free_time", after, before)
+
+    async def get_free_intervals(self, name, after, before=None):
+        """Return the list of the free intervals between two dates in a Schedule, see Schedule.get_free_intervals.
+
+        The list is shared by the callers of identical queries, and should not be modified.
+        """
+        return await self._query(name, "get_free_intervals", after, before)
+
+    async def get_availability(self, name, after, before=None, slot=timedelta(0, 900)):
+        """Return the Availability grid of the free slots between two dates in a Schedule, see Schedule.get_availability."""
+        return await self._query(name, "get_availability", after, before, slot)
+
+    async def place_tasks(self, name):
+        """Return the tuple (placed, unplaced) of the task placement of a Schedule, see Schedule.place_tasks."""
+        return await self._query(name, "place_tasks")
+
+    async def add_event(self, name, event):
+        """Add an event to a Schedule."""
+        await self._mutate(name, "add_event", event)
+
+    async def remove_event(self, name, event):
+        """Remove an event from a Schedule."""
+        await self._mutate(name, "remove_event", event)
+
+    async def move_event(self, name, event, start):
+        """Move an event of a Schedule to a new start."""
+        await self._mutate(name, "move_event", event, start)
+
+    async def add_task(self, name, task):
+        """Add a task to place in a Schedule."""
+        await self._mutate(name, "add_task", task)
+
+    async def complete_task(self, name, task):
+        """Remove a task done from a Schedule."""
+        await self._mutate(name, "complete_task", task)
@@ -1,10 +1,20 @@
 #!/usr/bin/python3
 
+import asyncio
+import io
+import os
+import random
+import tempfile
 import unittest
+from unittest import mock
 
-from datetime import datetime, timedelta
-from dateutil.rrule import rrule, YEARLY, DAILY, MO, TU, WE, TH, FR, SA, SU
-from otto import Event, Task, Occurrence, Schedule
+import otto
+from datetime import datetime, timedelta, timezone
+from dateutil.rrule import rrule, YEARLY, WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY, MO, TU, WE, TH, FR, SA, SU
+from otto import Event, Task, Occurrence, Schedule, OccurrenceCache, Timeline, schedule_many, packed_placement, find_common_slots, save_schedule, load_schedule
+from otto_ical import read_ics, write_ics, timeline_occurrences
+from otto_service import ScheduleService
+from otto_benchmark import generate_calendar, fixture_calendar, bench_calendar, compare
 
 
 class TestEventMethods(unittest.TestCase):
@@ -293,9 +303,615 @@ class TestScheduleMethods (unittest.TestCase):
         pass
 
     def test_freetime_simple(self):
-        pass                      
+        s = self.small_schedule()
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 23)), timedelta(0, 15*3600))
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 24), datetime(2016, 2, 25)), timedelta(0, 11*3600))
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 22, 2), datetime(2016, 2, 22, 5)), timedelta(0))
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 25, 22)), timedelta(0))
 
     def test_freetime_intervals(self):
-        pass
+        s = self.small_schedule()
+        self.assertEqual(s.get_free_intervals(datetime(2016, 2, 22), datetime(2016, 2, 23)),
+                         [(datetime(2016, 2, 22, 6), datetime(2016, 2, 22, 12)), (datetime(2016, 2, 22, 13), datetime(2016, 2, 22, 22))])
+        self.assertEqual(s.get_free_intervals(datetime(2016, 2, 24, 12, 30), datetime(2016, 2, 24, 20)),
+                         [(datetime(2016, 2, 24, 13), datetime(2016, 2, 24, 18))])
+        self.assertEqual(s.get_free_intervals(datetime(2016, 2, 22, 7), datetime(2016, 2, 22, 8)),
+                         [(datetime(2016, 2, 22, 7), datetime(2016, 2, 22, 8))])
+
+    def test_freetime_overlap(self):
+        s = self.small_schedule()
+        s.add_event(Event("early call", "overlaps the night", datetime(2016, 2, 22, 5), timedelta(0, 7200)))
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 23)), timedelta(0, 14*3600))
+        self.assertEqual(s.get_free_intervals(datetime(2016, 2, 22), datetime(2016, 2, 22, 12, 30))[0],
+                         (datetime(2016, 2, 22, 7), datetime(2016, 2, 22, 12)))
+
+    def test_overlapping(self):
+        s = self.small_schedule()
+        found = s.overlapping(datetime(2016, 2, 24, 12, 30), datetime(2016, 2, 24, 23))
+        self.assertEqual([o._event for o in found], [self.lunch, self.party, self.sleep])
+        self.assertEqual(s.overlapping(datetime(2016, 2, 22, 6), datetime(2016, 2, 22, 12)), [])
+
+    def test_init_lazy(self):
+        hourly = Event("ping", "every hour", datetime(2016, 1, 1), timedelta(0, 60), rrule(HOURLY, dtstart=datetime(2016, 1, 1)))
+        far = Task("far", "due in years", datetime(2016, 1, 1), timedelta(0, 60), 10, datetime(2030, 1, 1))
+        s = Schedule([hourly], [far], datetime(2016, 1, 1))
+        self.assertEqual(len(s._timeline), 0)
+        self.assertEqual(s.get_free_time(datetime(2020, 3, 2), datetime(2020, 3, 3)), timedelta(0, 24*59*60))
+        self.assertLess(len(s._timeline), 24*7*3)
+
+    def test_freetime_batch(self):
+        s = self.small_schedule()
+        windows = [(datetime(2016, 2, 22), datetime(2016, 2, 23)), (datetime(2016, 2, 24), datetime(2016, 2, 25)),
+                   (datetime(2016, 2, 22, 2), datetime(2016, 2, 22, 5)), (datetime(2016, 2, 23), datetime(2016, 2, 22))]
+        expected = [timedelta(0, 15*3600), timedelta(0, 11*3600), timedelta(0), timedelta(0)]
+        self.assertEqual(s.get_free_times(windows), expected)
+        with mock.patch.object(otto, "numpy", None):
+            s = self.small_schedule()
+            self.assertEqual(s.get_free_times(windows), expected)
+
+    def test_index_without_numpy(self):
+        s = self.small_schedule()
+        s.add_event(Event("early call", "overlaps the night", datetime(2016, 2, 22, 5), timedelta(0, 7200)))
+        s._ensure(s._start, s._end)
+        index = s._get_index()
+        with mock.patch.object(otto, "numpy", None):
+            fallback = otto._BusyIndex(s._timeline)
+        self.assertEqual((index._starts, index._ends, index._busy, index._first),
+                         (fallback._starts, fallback._ends, fallback._busy, fallback._first))
+
+    def test_place_tasks(self):
+        sleep = Event("sleep", "every night", datetime(2016, 2, 21, 22), timedelta(0, 28800), rrule(DAILY, dtstart=datetime(2016, 2, 21, 22)))
+        a = Task("a", "low priority", datetime(2016, 2, 22), timedelta(0, 3*3600), 10, datetime(2016, 2, 23))
+        b = Task("b", "high priority", datetime(2016, 2, 22), timedelta(0, 2*3600), 90, datetime(2016, 2, 23))
+        c = Task("c", "too long", datetime(2016, 2, 22), timedelta(0, 20*3600), 50, datetime(2016, 2, 25))
+        d = Task("d", "daily", datetime(2016, 2, 22), timedelta(0, 3600), 50, datetime(2016, 2, 22, 14), rrule(DAILY, dtstart=datetime(2016, 2, 22, 12)))
+        s = Schedule([sleep], [a, b, c, d], datetime(2016, 2, 22))
+        placed, unplaced = s.place_tasks()
+        self.assertEqual([(o._event, o._start) for o in placed],
+                         [(b, datetime(2016, 2, 22, 6)), (a, datetime(2016, 2, 22, 8)), (d, datetime(2016, 2, 22, 12)),
+                          (d, datetime(2016, 2, 23, 12)), (d, datetime(2016, 2, 24, 12))])
+        self.assertEqual(unplaced, [(c, datetime(2016, 2, 22))])
+        self.assertIs(s.place_tasks(), s.place_tasks())
+
+    def test_place_tasks_due(self):
+        busy = Event("busy", "all morning", datetime(2016, 2, 22), timedelta(0, 12*3600))
+        late = Task("late", "released too late", datetime(2016, 2, 22, 11), timedelta(0, 3600), 50, datetime(2016, 2, 22, 12, 30))
+        span = Task("span", "after a release cut", datetime(2016, 2, 22, 11), timedelta(0, 3*3600), 50, datetime(2016, 2, 23))
+        s = Schedule([busy], [late, span], datetime(2016, 2, 22))
+        placed, unplaced = s.place_tasks()
+        self.assertEqual([(o._event, o._start, o._duration) for o in placed], [(span, datetime(2016, 2, 22, 12), timedelta(0, 3*3600))])
+        self.assertEqual(unplaced, [(late, datetime(2016, 2, 22, 11))])
+
+    def test_changes(self):
+        s = self.small_schedule()
+        self.assertEqual(s.get_version(), 0)
+        meeting = Event("meeting", "once", datetime(2016, 2, 23, 9), timedelta(0, 3600))
+        s.add_event(meeting)
+        s.remove_event(self.party)
+        self.assertEqual(s.get_version(), 2)
+        self.assertEqual(s.get_changes(0), [(1, "add_event", meeting, datetime(2016, 2, 23, 9)),
+                                            (2, "remove_event", self.party, datetime(2016, 2, 24, 18))])
+        self.assertEqual(s.get_changes(1), [(2, "remove_event", self.party, datetime(2016, 2, 24, 18))])
+        self.assertEqual(s.get_free_time(datetime(2016, 2, 24), datetime(2016, 2, 25)), timedelta(0, 15*3600))
+
+    def test_move_event(self):
+        s = self.small_schedule()
+        s.get_free_time(s._start)
+        s.move_event(self.lunch, datetime(2016, 2, 22, 13))
+        s.move_event(self.party, datetime(2016, 2, 25, 14))
+        self.assertEqual(s.get_free_intervals(datetime(2016, 2, 24, 6), datetime(2016, 2, 25, 22)),
+                         [(datetime(2016, 2, 24, 6), datetime(2016, 2, 24, 13)), (datetime(2016, 2, 24, 14), datetime(2016, 2, 24, 22)),
+                          (datetime(2016, 2, 25, 6), datetime(2016, 2, 25, 13)), (datetime(2016, 2, 25, 18), datetime(2016, 2, 25, 22))])
+        self.assertEqual(s.get_changes(0)[0][3], datetime(2016, 2, 22, 12))
+
+    def test_move_shared_event(self):
+        s = self.small_schedule()
+        other = Schedule([self.sleep, self.lunch], [self.task], datetime(2016, 2, 22))
+        other.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 23))
+        moved = s.move_event(self.lunch, datetime(2016, 2, 22, 15))
+        self.assertIsNot(moved, self.lunch)
+        self.assertEqual(self.lunch._start, datetime(2016, 2, 22, 12))
+        lunches = lambda schedule: [o._start.hour for o in schedule._timeline if o._event._title == "lunch"]
+        other.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 26))
+        self.assertEqual(set(lunches(other)), {12})
+        s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 26))
+        self.assertEqual(set(lunches(s)), {15})
+        #the event given and the copy moved both stand for the moved event
+        s.move_event(self.lunch, datetime(2016, 2, 22, 16))
+        s.remove_event(moved)
+        self.assertEqual(lunches(s), [])
+
+    def test_replan(self):
+        s = self.small_schedule()
+        early = Task("early", "first thing", datetime(2016, 2, 22), timedelta(0, 3600), 50, datetime(2016, 2, 23))
+        s.add_task(early)
+        placed, unplaced = s.place_tasks()
+        self.assertEqual([(o._event, o._start) for o in placed], [(early, datetime(2016, 2, 22, 6)), (self.task, datetime(2016, 2, 22, 7))])
+        s.add_event(Event("call", "conflicts with the report", datetime(2016, 2, 22, 8), timedelta(0, 3600)))
+        placed, unplaced = s.place_tasks()
+        self.assertEqual([(o._event, o._start) for o in placed], [(early, datetime(2016, 2, 22, 6)), (self.task, datetime(2016, 2, 22, 9))])
+        s.complete_task(early)
+        late = Task("late", "pushes the end", datetime(2016, 2, 27), timedelta(0, 3600), 50, datetime(2016, 2, 28))
+        s.add_task(late)
+        placed, unplaced = s.place_tasks()
+        self.assertEqual([(o._event, o._start) for o in placed], [(self.task, datetime(2016, 2, 22, 6)), (late, datetime(2016, 2, 27, 6))])
+        self.assertEqual(s._end, datetime(2016, 2, 28))
+
+    def test_schedule_many(self):
+        self.small_schedule()
+        inputs = list()
+        for hour in range(10):
+            inputs.append(([self.sleep, self.lunch, Event("call", "once", datetime(2016, 2, 22, 6 + hour), timedelta(0, 3600))],
+                           [self.task, Task("review", "after the report", datetime(2016, 2, 22), timedelta(0, 3600), 90, datetime(2016, 2, 23))],
+                           datetime(2016, 2, 22)))
+        results = dict(schedule_many(inputs, chunksize=3, max_workers=2))
+        self.assertEqual(sorted(results), list(range(10)))
+        for i, (events, tasks, start) in enumerate(inputs):
+            self.assertEqual(results[i], packed_placement(Schedule(events, tasks, start)))
+        self.assertEqual(len(results[0][0]), 2)
+
+    def test_find_common_slots(self):
+        s = self.small_schedule()
+        horizon = [self.task]
+        other = Schedule([self.sleep, Event("gym", "morning", datetime(2016, 2, 22, 7), timedelta(0, 2*3600))], horizon, datetime(2016, 2, 22))
+        third = Schedule([Event("call", "noon", datetime(2016, 2, 22, 11), timedelta(0, 2*3600))], horizon, datetime(2016, 2, 22))
+        after, before = datetime(2016, 2, 22), datetime(2016, 2, 22, 23)
+        self.assertEqual(find_common_slots([s, other, third], timedelta(0, 3600), after, before),
+                         [(datetime(2016, 2, 22, 6), datetime(2016, 2, 22, 7)), (datetime(2016, 2, 22, 9), datetime(2016, 2, 22, 11)),
+                          (datetime(2016, 2, 22, 13), datetime(2016, 2, 22, 22))])
+        self.assertEqual(find_common_slots([s, other, third], timedelta(0, 7200), after, before, limit=1),
+                         [(datetime(2016, 2, 22, 9), datetime(2016, 2, 22, 11))])
+        self.assertEqual(find_common_slots([s, other, third], timedelta(0, 3600), after, before, limit=2, max_busy=1),
+                         [(datetime(2016, 2, 22, 6), datetime(2016, 2, 22, 12)), (datetime(2016, 2, 22, 13), datetime(2016, 2, 22, 22))])
+        self.assertRaises(ValueError, find_common_slots, [s, other, third], timedelta(0, 3600), after, before, limit=0)
+
+    def small_schedule(self):
+        self.sleep = Event("sleep", "every night", datetime(2016, 2, 21, 22), timedelta(0, 28800), rrule(DAILY, dtstart=datetime(2016, 2, 21, 22)))
+        self.lunch = Event("lunch", "every day", datetime(2016, 2, 22, 12), timedelta(0, 3600), rrule(DAILY, dtstart=datetime(2016, 2, 22, 12)))
+        self.party = Event("party", "once", datetime(2016, 2, 24, 18), timedelta(0, 14400))
+        self.task = Task("report", "write it", datetime(2016, 2, 22), timedelta(0, 7200), 50, datetime(2016, 2, 26))
+        return Schedule([self.sleep, self.lunch, self.party], [self.task], datetime(2016, 2, 22))
+
+    def test_init_sorted(self):
+        s = self.small_schedule()
+        s._ensure(s._start, s._end)
+        starts = [o._start for o in s._timeline]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(len(s._timeline), 4 + 4 + 1 + 1)
+
+    def test_init_truncated(self):
+        s = self.small_schedule()
+        s._ensure(s._start, s._end)
+        first = s._timeline[0]
+        self.assertEqual(first._event, self.sleep)
+        self.assertEqual(first._start, datetime(2016, 2, 22))
+        self.assertEqual(first._duration, timedelta(0, 21600))
+
+    def test_add_remove_event(self):
+        s = self.small_schedule()
+        meeting = Event("meeting", "once", datetime(2016, 2, 23, 9), timedelta(0, 3600))
+        s.add_event(meeting)
+        s._ensure(s._start, s._end)
+        starts = [o._start for o in s._timeline]
+        self.assertEqual(starts, sorted(starts))
+        self.assertIn(meeting, [o._event for o in s._timeline])
+        s.remove_event(self.lunch)
+        self.assertNotIn(self.lunch, [o._event for o in s._timeline])
+        self.assertEqual(len(s._timeline), 4 + 1 + 1 + 1)
+
+    def test_conflicts(self):
+        s = self.small_schedule()
+        self.assertEqual(list(s.conflicts()), [])
+        meeting = Event("meeting", "over lunch", datetime(2016, 2, 23, 11, 30), timedelta(0, 3600))
+        call = Event("call", "right after the meeting", datetime(2016, 2, 23, 12, 30), timedelta(0, 1800))
+        late = Event("late", "until the party", datetime(2016, 2, 24, 16), timedelta(0, 7200))
+        for e in (meeting, call, late):
+            s.add_event(e)
+        groups = [[o._event for o in g] for g in s.conflicts()]
+        self.assertEqual(groups, [[meeting, self.lunch, call]])
+        self.assertEqual(len(list(s.conflicts(datetime(2016, 2, 23, 12, 45), datetime(2016, 2, 24), first=True))), 1)
+        self.assertEqual(list(s.conflicts(datetime(2016, 2, 23, 13, 30))), [])
+
+    def test_fork(self):
+        s = self.small_schedule()
+        placed = [(o._event, o._start) for o in s.place_tasks()[0]]
+        text = str(s)
+        f = s.fork()
+        self.assertIs(f._timeline._starts, s._timeline._starts)
+        lunch = f.move_event(self.lunch, datetime(2016, 2, 22, 13))
+        task = f.set_priority(self.task, 90)
+        f.add_event(Event("meeting", "once", datetime(2016, 2, 22, 6), timedelta(0, 3600)))
+        self.assertIsNot(lunch, self.lunch)
+        self.assertEqual((self.lunch._start, self.task._priority, task._priority), (datetime(2016, 2, 22, 12), 50, 90))
+        self.assertEqual(str(s), text)
+        self.assertEqual([(o._event, o._start) for o in s.place_tasks()[0]], placed)
+        self.assertEqual([(o._event, o._start) for o in f.place_tasks()[0]], [(task, datetime(2016, 2, 22, 7))])
+        self.assertEqual(f.get_free_time(datetime(2016, 2, 23), datetime(2016, 2, 24)), timedelta(0, 3600 * 15))
+
+    def test_fork_diff_commit(self):
+        s = self.small_schedule()
+        f = s.fork()
+        f.move_event(self.party, datetime(2016, 2, 25, 14))
+        f.remove_event(self.lunch)
+        added, removed = f.diff(datetime(2016, 2, 24), datetime(2016, 2, 26))
+        self.assertEqual([(o._event, o._start) for o in added], [(self.party, datetime(2016, 2, 25, 14))])
+        self.assertEqual([(o._event, o._start) for o in removed],
+                         [(self.lunch, datetime(2016, 2, 24, 12)), (self.party, datetime(2016, 2, 24, 18)), (self.lunch, datetime(2016, 2, 25, 12))])
+        self.assertIs(f.commit(), s)
+        self.assertEqual(self.party._start, datetime(2016, 2, 24, 18))
+        self.assertEqual(str(s), str(f))
+        self.assertEqual(f.diff(), ([], []))
+
+    def test_advance(self):
+        s = self.small_schedule()
+        self.assertEqual(len(s.place_tasks()[0]), 1)
+        for day in range(1, 60):
+            #in the middle of the night, shaving the sleep going on
+            s.advance(datetime(2016, 2, 22, 3) + timedelta(day))
+            s.get_free_time(s._start, s._end)
+            fresh = Schedule([self.sleep, self.lunch, self.party], list(), s._start)
+            fresh._end = s._end
+            self.assertEqual(str(s), str(fresh))
+        self.assertEqual(s._end, datetime(2016, 4, 25, 3))
+        self.assertLessEqual(len(s._timeline._starts), 2 * len(s._timeline))
+        self.assertLessEqual(len(s._expanded), 2)
+        self.assertEqual(s.place_tasks(), ([], []))
+        after = s._start - timedelta(1)
+        self.assertEqual(s.get_free_time(after, s._start + timedelta(1)), fresh.get_free_time(after, fresh._start + timedelta(1)))
+        self.assertEqual(s.get_free_intervals(after, s._end), fresh.get_free_intervals(after, fresh._end))
+        self.assertEqual(s.get_free_times([(after, s._end)]), fresh.get_free_times([(after, fresh._end)]))
+        self.assertEqual(len(s.overlapping(after, s._start + timedelta(0, 3600))), 1)
+        self.assertEqual(list(s.conflicts()), [])
+        s.remove_event(self.sleep)
+        fresh.remove_event(self.sleep)
+        self.assertEqual(s.get_free_intervals(after, s._end), fresh.get_free_intervals(after, fresh._end))
+        self.assertRaises(ValueError, s.advance, s._start)
+        self.assertRaises(ValueError, s.advance, s._start + timedelta(1), s._end - timedelta(1))
+        s.advance(s._start + timedelta(1), s._end + timedelta(1))
+        self.assertEqual(s._end, datetime(2016, 4, 26, 3))
+
+    def test_availability(self):
+        s = self.small_schedule()
+        day, hour = datetime(2016, 2, 22), timedelta(0, 3600)
+        grid = s.get_availability(day, day + timedelta(1), hour)
+        self.assertEqual((len(grid), grid.count(), (~grid).count()), (24, 6 + 9, 24 - 6 - 9))
+        self.assertEqual(grid.intervals(), s.get_free_intervals(day + 6 * hour, day + 22 * hour))
+        self.assertEqual(grid.fits(2 * hour).count(), 5 + 8)
+        self.assertEqual(grid.fits(90 * timedelta(0, 60)).count(), 5 + 8)
+        other = Schedule([Event("call", "morning", day + 9 * hour, 2 * hour)], list(), day)
+        both = grid & other.get_availability(day, day + timedelta(1), hour)
+        self.assertEqual(both.intervals(), [(day + 6 * hour, day + 9 * hour), (day + 11 * hour, day + 12 * hour), (day + 13 * hour, day + 22 * hour)])
+        self.assertEqual((grid | other.get_availability(day, day + timedelta(1), hour)).count(), 24)
+        #the 25th slot would end after the window
+        self.assertEqual(len(s.get_availability(day, day + timedelta(1, 1800), hour)), 24)
+        self.assertRaises(ValueError, grid.__and__, s.get_availability(day, day + timedelta(1), 2 * hour))
+
+    def test_fork_changed_copies(self):
+        s = self.small_schedule()
+        f = s.fork()
+        f.move_event(self.party, datetime(2016, 2, 25, 14))
+        f.remove_event(self.party)
+        f.move_event(self.lunch, datetime(2016, 2, 22, 13))
+        f.move_event(self.lunch, datetime(2016, 2, 22, 14))
+        f.set_priority(self.task, 90)
+        f.complete_task(self.task)
+        f._ensure(f._start, f._end)
+        self.assertEqual([o for o in f._timeline if o._event._title == "party"], [])
+        self.assertEqual([o._start for o in f._timeline if o._event._title == "lunch"][:2], [datetime(2016, 2, 22, 14), datetime(2016, 2, 23, 14)])
+        self.assertEqual(f._tasks, [])
+        f.commit()
+        self.assertEqual(str(s), str(f))
+        self.assertEqual(f.diff(), ([], []))
+        self.assertEqual((s._tasks, f.place_tasks(), s.place_tasks()), ([], ([], []), ([], [])))
+
+    def test_profile(self):
+        stages = list()
+        with otto.profile(lambda stats, stage, seconds: stages.append(stage)) as stats:
+            s = self.small_schedule()
+            s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 23))
+            s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 23))
+        self.assertIsNone(otto._stats)
+        self.assertEqual(stats.calls["build"], 1)
+        self.assertEqual(stats.calls["get_free_time"], 2)
+        self.assertEqual(stats.calls["index"], 1)
+        self.assertEqual(stages.count("get_free_time"), 2)
+        #only the window from the 18th to the 25th was expanded
+        self.assertEqual(stats.expanded[self.lunch], 3)
+        self.assertEqual(stats.timeline_size, len(s._timeline))
+        self.assertTrue(0 <= stats.hit_rate() <= 1)
+        s.get_free_time(datetime(2016, 2, 22), datetime(2016, 2, 24))
+        self.assertEqual(stats.calls["get_free_time"], 2)
+        text = stats.prometheus()
+        self.assertIn('otto_stage_calls_total{stage="get_free_time"} 2\n', text)
+        self.assertIn('otto_expanded_occurrences_total{event="lunch"} 3\n', text)
+        self.assertIn("otto_timeline_occurrences {}\n".format(len(s._timeline)), text)
+
+    def test_save_load(self):
+        s = self.small_schedule()
+        placed, unplaced = s.place_tasks()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "schedule.otto")
+            save_schedule(s, path)
+            loaded = load_schedule(path)
+            self.assertIsInstance(loaded._timeline._starts, memoryview)
+            self.assertEqual(str(loaded), str(s))
+            self.assertEqual(loaded._expanded, s._expanded)
+            self.assertEqual([repr(t) for t in loaded._tasks], [repr(t) for t in s._tasks])
+            self.assertEqual([(o._start, o._duration) for o in loaded.place_tasks()[0]], [(o._start, o._duration) for o in placed])
+            loaded.add_event(Event("meeting", "once", datetime(2016, 2, 23, 9), timedelta(0, 3600)))
+            self.assertEqual(loaded.get_free_time(datetime(2016, 2, 23), datetime(2016, 2, 24)), timedelta(0, 3600 * 14))
+            self.assertEqual(s.get_free_time(datetime(2016, 2, 23), datetime(2016, 2, 24)), timedelta(0, 3600 * 15))
+
+    def test_load_not_a_schedule(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "schedule.otto")
+            with open(path, "wb") as f:
+                f.write(b"not a schedule" * 10)
+            with self.assertRaises(ValueError):
+                load_schedule(path)
+
+
+class TestTimelineMethods (unittest.TestCase):
+
+    def setUp(self):
+        self.a = Event("a", "d", datetime(2017, 2, 28), timedelta(0, 1800))
+        self.b = Event("b", "d", datetime(2017, 2, 28, 1), timedelta(0, 600))
+        self.timeline = Timeline()
+        a, b = self.timeline.event_id(self.a), self.timeline.event_id(self.b)
+        self.timeline.insert([(0, 10, a), (20, 30, a), (40, 50, a)])
+        self.timeline.insert([(5, 25, b), (20, 21, b)])
+
+    def test_insert(self):
+        self.assertEqual(list(self.timeline._starts), [0, 5, 20, 20, 40])
+        self.assertEqual(list(self.timeline._ends), [10, 25, 21, 30, 50])
+        self.assertEqual(self.timeline.event_id(self.b), 1)
+
+    def test_getitem(self):
+        o = self.timeline[1]
+        self.assertIs(o._event, self.b)
+        self.assertEqual(o._start, datetime(1970, 1, 1, 0, 0, 0, 5))
+        self.assertEqual(o._duration, timedelta(microseconds=20))
+        self.assertEqual([o._event for o in self.timeline[-2:]], [self.a, self.a])
+
+    def test_remove(self):
+        self.timeline.remove(self.b)
+        self.assertEqual(list(self.timeline._starts), [0, 20, 40])
+        self.assertEqual([o._event for o in self.timeline], [self.a]*3)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            self.a.anything = None
+        with self.assertRaises(AttributeError):
+            self.timeline[0].anything = None
+
+
+class TestOccurrenceCacheMethods (unittest.TestCase):
+
+    def setUp(self):
+        self.cache = OccurrenceCache(maxsize=24*7*2, window=timedelta(7))
+        self.hourly = Event("ping", "every hour", datetime(2016, 1, 1), timedelta(0, 60), rrule(HOURLY, dtstart=datetime(2016, 1, 1)))
+
+    def test_get(self):
+        w = self.cache.window_of(datetime(2016, 3, 1))
+        starts = self.cache.get(self.hourly, w, w+1)
+        self.assertEqual(len(starts), 24*7*2)
+        us = lambda d: (d - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        self.assertEqual(starts[0], us(self.cache.window_start(w)))
+        self.assertEqual(starts[-1], us(self.cache.window_start(w+2) - timedelta(0, 3600)))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_hits(self):
+        w = self.cache.window_of(datetime(2016, 3, 1))
+        first = self.cache.get(self.hourly, w, w)
+        self.assertEqual(self.cache.get(self.hourly, w, w), first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_maxsize(self):
+        w = self.cache.window_of(datetime(2016, 3, 1))
+        self.cache.get(self.hourly, w, w+2)
+        self.assertEqual(len(self.cache), 24*7*2)
+        self.cache.get(self.hourly, w+2, w+2)
+        self.cache.get(self.hourly, w, w)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 4))
+
+    def test_evicted_while_filling(self):
+        w = self.cache.window_of(datetime(2016, 3, 1))
+        self.cache.get(self.hourly, w, w)
+        self.cache.get(self.hourly, w+5, w+5)
+        #storing the missing window evicts the cached one after it, least recently used
+        starts = self.cache.get(self.hourly, w-1, w)
+        self.assertEqual(len(starts), 24*7*2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def random_rules(self, count):
+        rand = random.Random(0)
+        for i in range(count):
+            freq = rand.choice((WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY))
+            options = dict(dtstart=datetime(2016, 1, 1) + timedelta(0, rand.randrange(-10**8, 10**8)), interval=rand.randint(1, 12))
+            if rand.random() < 0.6:
+                options["byweekday"] = rand.sample((MO, TU, WE, TH, FR, SA, SU), rand.randint(1, 7))
+            if rand.random() < 0.3:
+                options["until"] = options["dtstart"] + timedelta(0, rand.randrange(10**7))
+            if rand.random() < 0.3:
+                options["wkst"] = rand.randrange(7)
+            span = {WEEKLY: 10**8, DAILY: 10**7, HOURLY: 10**6, MINUTELY: 3*10**4, SECONDLY: 2000}[freq]
+            after = options["dtstart"] + timedelta(0, rand.randrange(-span, span))
+            yield rrule(freq, **options), after, after + timedelta(0, rand.randrange(span))
+
+    def test_closed_form(self):
+        us = lambda d: (d - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+        for rule, after, before in self.random_rules(200):
+            expected = [us(d) for d in rule.between(after, before, inc=True) if d < before]
+            self.assertEqual(list(otto._expand(rule, us(after), us(before))), expected, str(rule))
+            with mock.patch.object(otto, "numpy", None):
+                self.assertEqual(list(otto._expand(rule, us(after), us(before))), expected, str(rule))
+
+    def test_closed_form_fallback(self):
+        self.assertIsNotNone(otto._closed_form(rrule(DAILY, dtstart=datetime(2016, 1, 1), byweekday=(MO, TU))))
+        self.assertIsNone(otto._closed_form(rrule(DAILY, dtstart=datetime(2016, 1, 1), count=10)))
+        self.assertIsNone(otto._closed_form(rrule(DAILY, dtstart=datetime(2016, 1, 1), byhour=(8, 20))))
+        self.assertIsNone(otto._closed_form(rrule(YEARLY, dtstart=datetime(2016, 1, 1))))
+
+    def test_aware(self):
+        utc = timezone.utc
+        aware = Event("call", "in UTC", datetime(2016, 1, 1, 9, tzinfo=utc), timedelta(0, 3600))
+        with self.assertRaises(ValueError):
+            Schedule([aware], list(), datetime(2016, 1, 1))
+        daily = Event("call", "in UTC", datetime(2016, 1, 1, 9), timedelta(0, 3600), rrule(DAILY, dtstart=datetime(2016, 1, 1, 9, tzinfo=utc)))
+        s = Schedule([daily], [Task("report", "write it", datetime(2016, 1, 1), timedelta(0, 3600), 50, datetime(2016, 1, 5))], datetime(2016, 1, 1))
+        with self.assertRaises(ValueError):
+            s.get_free_time(datetime(2016, 1, 1), datetime(2016, 1, 2))
+
+
+class TestICalendarMethods (unittest.TestCase):
+
+    def setUp(self):
+        self.items = [Event("sleep; deep", "every night,\nreally", datetime(2016, 2, 21, 22), timedelta(0, 28800),
+                            rrule(DAILY, dtstart=datetime(2016, 2, 21, 22), byweekday=(MO, FR))),
+                      Event("party " * 20, "once", datetime(2016, 2, 24, 18), timedelta(0, 14400)),
+                      Task("report", "write it", datetime(2016, 2, 22), timedelta(0, 7200), 50, datetime(2016, 2, 26),
+                           rrule(WEEKLY, dtstart=datetime(2016, 2, 22), until=datetime(2016, 4, 1), wkst=SU, byweekday=TU)),
+                      Event("nap", "starts later than the event", datetime(2016, 1, 1), timedelta(0, 1800),
+                            rrule(DAILY, dtstart=datetime(2016, 1, 1, 14))),
+                      Task("backup", "anytime", datetime.min, timedelta(0, 600), 20, datetime(2016, 1, 2),
+                           rrule(DAILY, dtstart=datetime(2016, 1, 1, 3)))]
+
+    def test_round_trip(self):
+        stream = io.StringIO(newline="")
+        self.assertEqual(write_ics(stream, self.items), 5)
+        text = stream.getvalue()
+        self.assertTrue(all(len(line) <= 75 for line in text.split("\r\n")))
+        #tasks carry their duration aside, a VTODO with a DUE having no DURATION
+        self.assertNotIn("\r\nDURATION:", text)
+        items = list(read_ics(io.StringIO(text, newline="")))
+        self.assertEqual([repr(i) for i in items], [repr(i) for i in self.items])
+        self.assertEqual(items[3]._repeating[0], datetime(2016, 1, 1, 14))
+
+    def test_read(self):
+        text = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+DTSTART;TZID="Europe/Paris:Central":20160222T090000
+DURATION:PT1H30M
+SUMMARY:stand
+ up
+RRULE:FREQ=WEEKLY;BYDAY=MO,1WE;COUNT=3
+BEGIN:VALARM
+DESCRIPTION:not this one
+END:VALARM
+DESCRIPTION:every week
+END:VEVENT
+BEGIN:VTODO
+SUMMARY:no due date
+END:VTODO
+BEGIN:VTODO
+DUE;VALUE=DATE:20160301
+PRIORITY:1
+END:VTODO
+END:VCALENDAR
+"""
+        event, task = read_ics(io.StringIO(text))
+        self.assertEqual((event._title, event._description), ("standup", "every week"))
+        self.assertEqual((event._start, event._duration), (datetime(2016, 2, 22, 9), timedelta(0, 5400)))
+        self.assertEqual(list(event._repeating), [datetime(2016, 2, 22, 9), datetime(2016, 2, 24, 9), datetime(2016, 2, 29, 9)])
+        self.assertEqual((task._priority, task._due, task._duration), (9, datetime(2016, 3, 1), timedelta(0)))
+
+    def test_write_timeline(self):
+        s = Schedule(self.items[:2] + self.items[3:4], [], datetime(2016, 2, 22))
+        s._end = datetime(2016, 2, 29)
+        stream = io.StringIO(newline="")
+        write_ics(stream, timeline_occurrences(s))
+        occurrences = list(read_ics(io.StringIO(stream.getvalue(), newline="")))
+        self.assertEqual([(o._start, o._duration) for o in occurrences], [(o._start, o._duration) for o in s._timeline])
+        self.assertTrue(all(o._repeating == None for o in occurrences))
+
+
+class TestScheduleServiceMethods (unittest.TestCase):
+
+    def setUp(self):
+        self.sleep = Event("sleep", "every night", datetime(2016, 2, 21, 22), timedelta(0, 28800), rrule(DAILY, dtstart=datetime(2016, 2, 21, 22)))
+        self.task = Task("report", "write it", datetime(2016, 2, 22), timedelta(0, 7200), 50, datetime(2016, 2, 26))
+
+    def run_service(self, queries):
+        async def main():
+            service = ScheduleService()
+            await service.build("home", [self.sleep], [self.task], datetime(2016, 2, 22))
+            return service, await queries(service)
+        return asyncio.run(main())
+
+    def test_queries(self):
+        async def queries(service):
+            return await asyncio.gather(service.get_free_time("home", datetime(2016, 2, 23), datetime(2016, 2, 24)),
+                                        service.get_free_intervals("home", datetime(2016, 2, 23), datetime(2016, 2, 24)),
+                                        service.place_tasks("home"))
+        service, (free, intervals, (placed, unplaced)) = self.run_service(queries)
+        self.assertEqual(free, timedelta(0, 3600 * 16))
+        self.assertEqual(intervals, [(datetime(2016, 2, 23, 6), datetime(2016, 2, 23, 22))])
+        self.assertEqual([o._start for o in placed], [datetime(2016, 2, 22, 6)])
+        self.assertEqual(service.names(), ["home"])
+
+    def test_coalesced(self):
+        async def queries(service):
+            query = lambda: service.get_free_time("home", datetime(2016, 2, 23), datetime(2016, 2, 24))
+            first = await asyncio.gather(*(query() for i in range(5)))
+            meeting = Event("meeting", "once", datetime(2016, 2, 23, 9), timedelta(0, 3600))
+            await service.add_event("home", meeting)
+            return first + await asyncio.gather(query(), query())
+        service, results = self.run_service(queries)
+        self.assertEqual(results, [timedelta(0, 3600 * 16)] * 5 + [timedelta(0, 3600 * 15)] * 2)
+        self.assertEqual(service._pending, dict())
+        self.assertEqual(service.coalesced, 4 + 1)
+
+    def test_change_waiting(self):
+        async def queries(service):
+            query = lambda: service.get_free_time("home", datetime(2016, 2, 23), datetime(2016, 2, 24))
+            meeting = Event("meeting", "once", datetime(2016, 2, 23, 9), timedelta(0, 3600))
+            #the second query is asked for after the change, while the first one is still computing
+            before = asyncio.ensure_future(query())
+            change = asyncio.ensure_future(service.add_event("home", meeting))
+            after = asyncio.ensure_future(query())
+            await change
+            return await asyncio.gather(before, after)
+        service, results = self.run_service(queries)
+        self.assertEqual(results, [timedelta(0, 3600 * 16), timedelta(0, 3600 * 15)])
+        self.assertEqual(service.coalesced, 0)
+
+    def test_unknown(self):
+        async def queries(service):
+            await service.drop("home")
+            return await service.get_free_time("home", datetime(2016, 2, 23))
+        with self.assertRaises(KeyError):
+            self.run_service(queries)
+
+
+class TestBenchmarkMethods (unittest.TestCase):
+
+    def test_generate_calendar(self):
+        events, tasks, start = generate_calendar(50, recurring=0.2, density=4, tasks=20, horizon=30)
+        self.assertEqual((len(events), len(tasks)), (50, 20))
+        self.assertTrue(0 < sum(e._repeating != None for e in events) < 50)
+        self.assertEqual([repr(e) for e in events], [repr(e) for e in generate_calendar(50, recurring=0.2, density=4, tasks=20, horizon=30)[0]])
+
+    def test_fixtures(self):
+        measures = bench_calendar(*fixture_calendar(), queries=10)
+        s = Schedule(*fixture_calendar())
+        s._ensure(s._start, s._end)
+        self.assertEqual(measures["occurrences"], len(s._timeline))
+        self.assertGreater(measures["peak_mb"], 0)
+
+    def test_compare(self):
+        previous = {"cases": {"small": {"build_s": 1.0, "place_s": 1.0, "occurrences": 10, "occurrences_per_s": 10.0}}}
+        current = {"cases": {"small": {"build_s": 1.1, "place_s": 2.0, "occurrences": 100, "occurrences_per_s": 30.0}, "new": {"build_s": 1.0}}}
+        self.assertEqual(list(compare(previous, current)), [("small", "place_s", 1.0, 2.0)])
+        #throughput is better higher
+        current["cases"]["small"]["occurrences_per_s"] = 3.0
+        self.assertEqual(list(compare(previous, current)), [("small", "place_s", 1.0, 2.0), ("small", "occurrences_per_s", 10.0, 3.0)])
+        #latencies are far below the floor of the whole run times
+        previous["cases"]["small"]["free_time_p50_s"] = 9e-6
+        current["cases"]["small"]["free_time_p50_s"] = 9e-4
+        self.assertIn(("small", "free_time_p50_s", 9e-6, 9e-4), list(compare(previous, current)))
+        current["cases"]["small"]["free_time_p50_s"] = 1e-5
+        self.assertNotIn("free_time_p50_s", [measure for _, measure, _, _ in compare(previous, current)])
+
+
 if __name__ == "__main__":
     unittest.main()